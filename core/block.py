@@ -1,10 +1,31 @@
-import hashlib
 import json
+import multiprocessing
+import operator
+import os
+import queue
+import struct
+from core.pow_kernel import double_sha256, find_nonce, meets_difficulty
+
+
+# ── Versiones de header ──────────────────────────────────────────
+# 1: el hash es el doble SHA256 del JSON ordenado del bloque completo
+#    (TXs incluidas). Es el formato del génesis y de las cadenas viejas.
+# 2: header binario de tamaño fijo con la raíz Merkle de las TXs; el
+#    nonce va al final en ASCII decimal para que el midstate cubra todo
+#    lo demás.
+BLOCK_VERSION      = 2
+SUPPORTED_VERSIONS = (1, 2)
+
+# version, index, timestamp, previous_hash, difficulty, merkle_root
+HEADER_V2 = struct.Struct("<IQd32sI32s")
+
+# Cada cuánto el minado paralelo mira si quedan workers vivos
+POW_POLL_SECONDS = 0.5
 
 
 def _double_sha256(data: bytes) -> str:
     """SHA256(SHA256(data)) — igual que Bitcoin. Devuelve hex string."""
-    return hashlib.sha256(hashlib.sha256(data).digest()).hexdigest()
+    return double_sha256(data).hex()
 
 
 def _serialize_deterministic(data) -> bytes:
@@ -12,10 +33,52 @@ def _serialize_deterministic(data) -> bytes:
     return json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")
 
 
+def _hash_bytes(hash_hex) -> bytes:
+    """
+    Hash del bloque en bytes crudos para chequear el PoW sin pasar por
+    strings. Un hash que no es hex válido (bloque mal formado de un peer)
+    se mapea a un digest que nunca cumple la dificultad.
+    """
+    try:
+        return bytes.fromhex(hash_hex)
+    except (TypeError, ValueError):
+        return b"\xff" * 32
+
+
+def merkle_root(leaves: list) -> bytes:
+    """
+    Raíz Merkle al estilo Bitcoin: se hashean los nodos de a pares con
+    doble SHA256 y, si un nivel queda impar, se duplica el último.
+    Una lista vacía da 32 bytes en cero.
+    """
+    if not leaves:
+        return bytes(32)
+    level = list(leaves)
+    while len(level) > 1:
+        if len(level) & 1:
+            level.append(level[-1])
+        level = [double_sha256(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+    return level[0]
+
+
+def _pow_worker(prefix, suffix, difficulty, start, stride, stop_event, results):
+    """
+    Worker de minado paralelo. Prueba los nonces start, start+stride, ...
+    (su clase de residuos) hasta encontrar uno válido o hasta que otro
+    worker levante stop_event. Recibe solo los bytes del header — no el
+    bloque entero — para no tener que picklear las TXs.
+    """
+    found = find_nonce(prefix, suffix, difficulty, start, stride, stop_event)
+    if found is not None:
+        results.put(found)
+        stop_event.set()
+
+
 class Block:
 
     def __init__(self, index, timestamp, transactions, previous_hash,
-                 difficulty=2, nonce=0, hash=None):
+                 difficulty=2, nonce=0, hash=None, workers=1, version=BLOCK_VERSION):
+        self.version       = version
         self.index         = index
         self.timestamp     = timestamp
         self.transactions  = transactions
@@ -25,56 +88,230 @@ class Block:
 
         if hash is not None:
             self.hash = hash
+        elif workers > 1:
+            self.hash = self.mine_block_parallel(workers)
         else:
             self.hash = self.mine_block()
 
+    @property
+    def hash_bytes(self) -> bytes:
+        # Derivado de .hash en cada acceso (fromhex de 32 bytes es barato):
+        # una copia guardada quedaría vieja si después se reasigna el hash
+        return _hash_bytes(self.hash)
+
+    @property
+    def transactions(self) -> list:
+        return self._transactions
+
+    @transactions.setter
+    def transactions(self, txs):
+        # Otra lista de TXs: todo lo derivado de ellas se vuelve a calcular
+        self._transactions       = txs
+        self._tx_refs            = tuple(txs)
+        self._tx_data_cached     = None
+        self._merkle_root_cached = None
+        self._header_cache       = (None, None)   # (campos del header, partes)
+        self._json_cache         = (None, {})     # (hash, {formato: bytes})
+
+    def _check_tx_cache(self):
+        """
+        Si la lista se modificó en el lugar (TX agregada, sacada o
+        reemplazada) desde que se cachearon, invalida las caches derivadas
+        de las TXs. Compara identidad de objetos: O(n) sin serializar nada.
+        Un Transaction no se modifica después de entrar a un bloque (su id
+        tampoco se recalcula), así que no se re-serializa para detectarlo.
+        """
+        txs = self._transactions
+        if len(txs) != len(self._tx_refs) or any(map(operator.is_not, txs, self._tx_refs)):
+            self.transactions = txs
+
+    def _tx_data(self) -> list:
+        """
+        Las TXs serializadas a dict, calculadas una sola vez por lista de
+        TXs: el hash, el minado y to_dict() reutilizan el mismo resultado.
+        """
+        self._check_tx_cache()
+        if self._tx_data_cached is None:
+            self._tx_data_cached = [tx.to_dict() for tx in self.transactions]
+        return self._tx_data_cached
+
+    def merkle_root(self) -> bytes:
+        """
+        Raíz Merkle de las TXs del bloque (header v2), calculada una vez.
+        Cada hoja es el doble SHA256 de la TX serializada completa — firmas
+        incluidas — así el header compromete exactamente lo mismo que el
+        JSON del formato v1.
+        """
+        self._check_tx_cache()
+        if self._merkle_root_cached is None:
+            self._merkle_root_cached = merkle_root([
+                double_sha256(_serialize_deterministic(tx)) for tx in self._tx_data()
+            ])
+        return self._merkle_root_cached
+
     def _header_data(self) -> dict:
         """
-        Datos que entran en el hash del bloque.
+        Datos que entran en el hash de un bloque v1.
         Serialización determinística: siempre produce los mismos bytes
         para el mismo bloque, en cualquier nodo.
         """
-        tx_data = [
-            tx.to_dict() if hasattr(tx, "to_dict") else tx
-            for tx in self.transactions
-        ]
         return {
             "index":         self.index,
             "timestamp":     self.timestamp,
-            "transactions":  tx_data,
+            "transactions":  self._tx_data(),
             "previous_hash": self.previous_hash,
             "difficulty":    self.difficulty,
             "nonce":         self.nonce,
         }
 
+    def _header_parts(self) -> tuple:
+        """
+        Parte el header serializado en (prefijo, sufijo) alrededor del valor
+        del nonce.
+
+        v2: el header binario va entero en el prefijo y el sufijo es vacío.
+        v1: como las claves van ordenadas, "nonce" queda entre
+        "index" y "previous_hash": todo lo demás es constante durante el
+        minado, así que se serializa una sola vez.
+        Las TXs van después del nonce y las comillas dentro de strings se
+        escapan, así que la primera aparición de '"nonce":' es la del header.
+        """
+        if self.version == 2:
+            header = HEADER_V2.pack(
+                self.version,
+                self.index,
+                self.timestamp,
+                _hash_bytes(self.previous_hash),
+                self.difficulty,
+                self.merkle_root(),
+            )
+            return header, b""
+        if self.version != 1:
+            raise ValueError(f"Versión de bloque no soportada: {self.version}")
+
+        header          = self._header_data()
+        header["nonce"] = 0
+        data            = _serialize_deterministic(header)
+        before, _, after = data.partition(b'"nonce":0')
+        return before + b'"nonce":', after
+
+    def _cached_header_parts(self) -> tuple:
+        """
+        _header_parts memorizado. Se recalcula si cambió algún campo del
+        header o la lista de TXs (p. ej. un bloque adulterado), así
+        re-validar un bloque no vuelve a armar el JSON ni el struct.
+        """
+        self._check_tx_cache()
+        campos = (self.version, self.index, self.timestamp,
+                  self.previous_hash, self.difficulty)
+        if self._header_cache[0] != campos:
+            self._header_cache = (campos, self._header_parts())
+        return self._header_cache[1]
+
     def calculate_hash(self) -> str:
         """
         Hash del bloque usando doble SHA256 y serialización determinística.
-        El nonce NO entra en tx_data — solo en el header — así el minado
-        solo modifica el nonce sin recalcular las TXs.
+        Produce exactamente los mismos bytes que serializar el header
+        completo: prefijo + nonce + sufijo.
         """
-        data = _serialize_deterministic(self._header_data())
-        return _double_sha256(data)
+        prefix, suffix = self._cached_header_parts()
+        return double_sha256(prefix, b"%d" % self.nonce, suffix).hex()
 
     def mine_block(self) -> str:
-        """Proof of Work: busca nonce tal que el hash empiece con N ceros."""
-        target       = "0" * self.difficulty
-        hash_attempt = self.calculate_hash()
+        """
+        Proof of Work: busca nonce tal que el hash empiece con N ceros.
+        Truco del midstate (igual que Bitcoin): el estado SHA256 del prefijo
+        se calcula una vez y por cada intento solo se copia el contexto y se
+        hashean el nonce y el sufijo — sin volver a armar el JSON.
+        El loop vive en core/pow_kernel.py.
+        """
+        prefix, suffix = self._header_parts()
+        self.nonce, digest = find_nonce(prefix, suffix, self.difficulty, start=self.nonce)
+        return digest.hex()
 
-        while not hash_attempt.startswith(target):
-            self.nonce += 1
-            hash_attempt = self.calculate_hash()
+    def mine_block_parallel(self, workers=None) -> str:
+        """
+        Proof of Work repartido entre procesos: el worker k prueba los
+        nonces k, k+N, k+2N, ... y el primero que encuentra uno válido
+        frena al resto. Con dificultad < 3 el costo de levantar procesos
+        supera al del minado, así que se usa mine_block.
 
-        return hash_attempt
+        Los workers se crean con fork aunque el nodo ya tenga threads
+        (Flask, executor de P2P): el hijo solo corre _pow_worker, que
+        hashea bytes con hashlib y usa el Event/Queue creados acá; no toca
+        locks, sockets ni estado heredado de esos threads. spawn/forkserver
+        no sirven: re-importan el script principal, y run_node.py arranca
+        un nodo al importarse. Donde no hay fork se mina en este proceso.
+        Si todos los workers mueren sin resultado, también.
+        """
+        workers = workers or os.cpu_count() or 1
+        if (workers < 2 or self.difficulty < 3
+                or "fork" not in multiprocessing.get_all_start_methods()):
+            return self.mine_block()
+
+        prefix, suffix = self._header_parts()
+        ctx        = multiprocessing.get_context("fork")
+        stop_event = ctx.Event()
+        results    = ctx.Queue()
+
+        procs = [
+            ctx.Process(
+                target=_pow_worker,
+                args=(prefix, suffix, self.difficulty,
+                      self.nonce + k, workers, stop_event, results),
+                daemon=True,
+            )
+            for k in range(workers)
+        ]
+        for p in procs:
+            p.start()
+
+        found = None
+        try:
+            while found is None:
+                try:
+                    found = results.get(timeout=POW_POLL_SECONDS)
+                except queue.Empty:
+                    if all(p.exitcode is not None for p in procs):
+                        # Un worker pudo dejar el resultado justo antes de salir
+                        try:
+                            found = results.get(timeout=POW_POLL_SECONDS)
+                        except queue.Empty:
+                            break
+        finally:
+            stop_event.set()
+            for p in procs:
+                p.join()
+
+        if found is None:
+            return self.mine_block()   # murieron todos (OOM, kill, excepción)
+        self.nonce, digest = found
+        return digest.hex()
+
+    def cached_json(self, kind, build) -> bytes:
+        """
+        JSON ya serializado del bloque en el formato `kind` ("wire" para
+        /p2p, "api" para la API REST); `build(block)` lo arma la primera
+        vez. Un bloque confirmado no cambia, así que se reusa en cada sync
+        y cada consulta. Vive en el bloque: uno descartado por reorg se
+        lleva su cache, y se invalida si cambian las TXs o el hash.
+        """
+        self._check_tx_cache()
+        hash_, cache = self._json_cache
+        if hash_ != self.hash:
+            cache = {}
+            self._json_cache = (self.hash, cache)
+        data = cache.get(kind)
+        if data is None:
+            data = cache[kind] = build(self)
+        return data
 
     def to_dict(self):
         return {
+            "version":       self.version,
             "index":         self.index,
             "timestamp":     self.timestamp,
-            "transactions":  [
-                tx.to_dict() if hasattr(tx, "to_dict") else tx
-                for tx in self.transactions
-            ],
+            "transactions":  self._tx_data(),
             "previous_hash": self.previous_hash,
             "difficulty":    self.difficulty,
             "nonce":         self.nonce,
@@ -83,12 +320,14 @@ class Block:
 
     @staticmethod
     def from_dict(data):
+        """
+        Reconstruye un bloque desde su dict (disco o red). Las TXs se
+        convierten a Transaction acá, una sola vez: el resto del código
+        asume que block.transactions solo tiene objetos Transaction.
+        """
         from core.transaction import Transaction
 
-        transactions = [
-            Transaction.from_dict(tx) if isinstance(tx, dict) else tx
-            for tx in data["transactions"]
-        ]
+        transactions = [Transaction.from_dict(tx) for tx in data["transactions"]]
 
         return Block(
             index         = data["index"],
@@ -98,4 +337,5 @@ class Block:
             difficulty    = data["difficulty"],
             nonce         = data["nonce"],
             hash          = data["hash"],
+            version       = data.get("version", 1),   # bloques viejos no traen versión
         )
\ No newline at end of file
@@ -1,16 +1,38 @@
-from core.block import Block
+from core.block import Block, SUPPORTED_VERSIONS, meets_difficulty
+import collections
+import heapq
+import itertools
+import logging
+import os
+import struct
+import threading
 import time
-from core.transaction import Transaction, TxInput, TxOutput
-import copy
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from core.transaction import Transaction, TxInput, TxOutput, verify_signature
+from core.muhash import MuHash
+from core.utxo import UTXOOverlay, UtxoSet, utxo_bytes, utxo_key
 from storage import storage
 
 
+# Las trazas por TX/bloque van a logging: con el nivel por defecto no se
+# formatean ni tocan stdout, que bajo spam era lo más caro de add_transaction
+logger = logging.getLogger(__name__)
 
 
 MAX_TX_PER_BLOCK  = 5
 MAX_MEMPOOL_SIZE  = 500
 TX_EXPIRY_SECONDS = 24 * 60 * 60
 
+# La mempool se escribe a disco como mucho una vez cada tantos segundos
+MEMPOOL_FLUSH_SECONDS = 2
+
+# Por debajo de esta cantidad de firmas no vale la pena levantar procesos
+PARALLEL_VERIFY_MIN_SIGS = 256
+
+# TXs cuyas firmas ya se verificaron (al entrar a la mempool o en un bloque)
+VALIDATED_TX_CACHE_SIZE = 100_000
+
 # ── Política monetaria ────────────────────────────────────────────
 INITIAL_REWARD      = 50          # coins por bloque al inicio
 HALVING_INTERVAL    = 210         # cada cuántos bloques se reduce la recompensa a la mitad
@@ -30,8 +52,13 @@ def get_mining_reward(block_index: int) -> float:
     ...
     Cuando la recompensa llega a 0 los mineros solo cobran fees.
     """
-    halvings = block_index // HALVING_INTERVAL
-    reward   = INITIAL_REWARD / (2 ** halvings)
+    return _reward_for_halvings(block_index // HALVING_INTERVAL)
+
+
+@lru_cache(maxsize=None)
+def _reward_for_halvings(halvings: int) -> float:
+    """Recompensa tras `halvings` halvings — pocos valores distintos, se cachean."""
+    reward = INITIAL_REWARD / (2 ** halvings)
     return max(0, reward)
 
 
@@ -39,75 +66,218 @@ class Blockchain:
     def __init__(self, difficulty):
         self.difficulty = difficulty
         self.chain = []
-        self.pending_transactions = []
-        self.utxo_set = {}       # {(tx_id, output_index): TxOutput}
-        self.tx_index = {}       # {tx_id: block_index} — búsqueda O(1) por tx_id
+        self.pending_transactions = {}   # {tx_id: Transaction} — mempool
+        self.utxo_set = UtxoSet()  # {utxo_key(tx_id, output_index): TxOutput} + índice por dueño
+        self.utxo_hash = MuHash()  # MuHash del utxo_set, actualizado por bloque
+        self.tx_index = {}       # {tx_id: (block_index, posición en el bloque)}
+        self.blocks_by_hash = {}   # {block.hash: Block} de la cadena actual
+        self.locked_utxos = set()  # UTXOs gastados por TXs de la mempool
+        self.mempool_heap = []     # [(-fee, seq, tx)] — max-heap por fee
+        self._mempool_seq = itertools.count()
+        self._mempool_dirty = False
+        self._mempool_timer = None
+        self._mempool_lock  = threading.Lock()
+        # Cadena + UTXO set: add_block y el reorg de Node (rewind_utxo →
+        # commit_utxo) los modifican juntos, nunca a la vez
+        self.chain_lock     = threading.RLock()
+        self._delta_ops     = 0    # operaciones en utxo_delta.log desde el snapshot
+        self.tip_cv         = threading.Condition()   # avisa cambios de tip/mempool
+        self.validated_txs  = collections.OrderedDict()  # {tx_id: firmas ya verificadas}
 
         if storage.has_saved_data():
             # ── Caso A: ya existe una blockchain guardada → la cargamos ──
             print("📂 Encontré datos en disco, cargando blockchain...")
             self.chain                = storage.load_chain()
-            self.utxo_set             = storage.load_utxo_set()
-            self.pending_transactions = storage.load_mempool()
-            self._rebuild_tx_index()
+            self.utxo_set, height, self.utxo_hash = storage.load_utxo_set()
+            self.pending_transactions = {tx.id: tx for tx in storage.load_mempool()}
+            if self.utxo_set is None or (height is not None and height != len(self.chain) - 1):
+                # Cierre abrupto entre append_block y el delta: el UTXO set
+                # quedó desfasado de la cadena, se recalcula desde los bloques
+                print("⚠️  UTXO set desfasado de la cadena, reconstruyendo...")
+                self.utxo_set  = self.rebuild_utxo_set()
+                self.utxo_hash = None
+            if self.utxo_hash is None:
+                self.rebuild_utxo_hash()
+                storage.save_utxo_set(self.utxo_set, height=len(self.chain) - 1,
+                                      utxo_hash=self.utxo_hash)
+            self.rebuild_indexes()
+            self.rebuild_mempool_index()
             print("✅ Blockchain restaurada desde disco")
         else:
             # ── Caso B: primera vez → creamos el bloque génesis ──
             print("🌱 No hay datos en disco, creando blockchain nueva...")
             self.create_genesis_block()
+            self.rebuild_utxo_hash()
             storage.save_all(self)   # guardamos el estado inicial
 
+    @property
+    def utxo_set(self):
+        return self._utxo_set
+
+    @utxo_set.setter
+    def utxo_set(self, utxos):
+        # Lo que se asigne (carga de disco, rebuild, reorg) queda indexado por dueño
+        if utxos is not None and not isinstance(utxos, UtxoSet):
+            utxos = UtxoSet(utxos)
+        self._utxo_set = utxos
+
     # ======================
     # TRANSACTIONS
     # ======================
 
     def add_transaction(self, tx):
-        print("\n--- ADD TRANSACTION ---")
-        print("TX ID:", tx.id)
+        logger.debug("ADD TRANSACTION %s", tx.id)
 
-        for tx_input in tx.inputs:
-            key = (tx_input.tx_id, tx_input.output_index)
+        if not tx.has_valid_id():
+            logger.debug("❌ El ID no corresponde al contenido de la TX")
+            return False
 
+        try:
+            keys = [utxo_key(i.tx_id, i.output_index) for i in tx.inputs]
+        except (AttributeError, TypeError, ValueError, OverflowError) as e:
+            logger.debug("❌ Input mal formado: %s", e)
+            return False
+
+        for key in keys:
             if key not in self.utxo_set:
-                print("❌ UTXO inexistente:", key)
+                logger.debug("❌ UTXO inexistente: %s", key.hex())
                 return False
 
-            if key in self.get_locked_utxos():
-                print("❌ UTXO lockeado:", key)
+            if key in self.locked_utxos:
+                logger.debug("❌ UTXO lockeado: %s", key.hex())
                 return False
 
-        input_sum = sum(self.utxo_set[(i.tx_id, i.output_index)].amount for i in tx.inputs)
-        output_sum = sum(o.amount for o in tx.outputs)
-
-        print("Input sum:", input_sum)
-        print("Output sum:", output_sum)
-
-        if input_sum < output_sum:
-            print("❌ Input < Output")
-            return False
-
+        # Suma inputs/outputs (rechaza input < output), verifica firmas y da el fee
         try:
-            tx.verify(self.utxo_set)
+            fee = self._check_tx(tx, self.utxo_set)
         except Exception as e:
-            print("❌ Verify falló:", e)
+            logger.debug("❌ Verify falló: %s", e)
             return False
 
-        # Límite de mempool — rechazar si está llena
+        # Límite de mempool — si está llena, la TX entra solo desalojando
+        # a la de menor fee, y solo si paga estrictamente más que ella
         if len(self.pending_transactions) >= MAX_MEMPOOL_SIZE:
-            print(f"❌ Mempool llena ({MAX_MEMPOOL_SIZE} TXs), TX rechazada")
+            if not self._evict_lowest_fee(fee):
+                logger.debug("❌ Mempool llena (%d TXs), TX rechazada", MAX_MEMPOOL_SIZE)
+                return False
+
+        logger.debug("✅ TX aceptada (fee %s)", fee)
+        tx.fee = fee
+        self.pending_transactions[tx.id] = tx
+        self.locked_utxos.update(keys)
+        heapq.heappush(self.mempool_heap, (-tx.fee, next(self._mempool_seq), tx))
+        self.mark_mempool_dirty()   # se persiste en lote, no por cada TX
+        self.notify_tip()
+        return True
+
+    def _check_tx(self, tx, utxo):
+        """
+        Como tx.verify: UTXOs, montos y firmas contra `utxo`; devuelve el
+        fee o lanza excepción. Las firmas se saltean si esta TX ya se
+        verificó con exactamente las mismas (clave, firma, hash): el id no
+        cubre las firmas, así que se compara la tupla completa.
+        """
+        fee, firmas = tx.check_inputs(utxo)
+        firmas = tuple(firmas)
+        if self.validated_txs.get(tx.id) != firmas:
+            for firma in firmas:
+                if not verify_signature(*firma):
+                    raise Exception("Firma inválida")
+            self._remember_validated(tx.id, firmas)
+        return fee
+
+    def _remember_validated(self, tx_id, firmas):
+        self.validated_txs[tx_id] = firmas
+        if len(self.validated_txs) > VALIDATED_TX_CACHE_SIZE:
+            self.validated_txs.popitem(last=False)   # la más vieja
+
+    def mark_mempool_dirty(self):
+        """
+        Marca la mempool como modificada y agenda un flush_mempool dentro
+        de MEMPOOL_FLUSH_SECONDS. Una ráfaga de TXs termina en una sola
+        escritura en vez de reescribir mempool.json por cada una.
+        """
+        with self._mempool_lock:
+            self._mempool_dirty = True
+            if self._mempool_timer is None:
+                self._mempool_timer = threading.Timer(MEMPOOL_FLUSH_SECONDS, self.flush_mempool)
+                self._mempool_timer.daemon = True
+                self._mempool_timer.start()
+
+    def flush_mempool(self):
+        """Escribe la mempool a disco ahora si tiene cambios pendientes."""
+        with self._mempool_lock:
+            if self._mempool_timer is not None:
+                self._mempool_timer.cancel()
+                self._mempool_timer = None
+            if not self._mempool_dirty:
+                return
+            self._mempool_dirty = False
+            # Se escribe con el lock tomado: el timer y el minero no pueden
+            # pisarse y dejar en disco una mempool más vieja que la última
+            storage.save_mempool(list(self.pending_transactions.values()))
+
+    def _evict_lowest_fee(self, fee):
+        """
+        Saca de la mempool la TX de menor fee (la más nueva si hay empate)
+        si `fee` la supera. Devuelve True si liberó un lugar.
+        Es O(n), pero solo corre con la mempool llena.
+        """
+        # De paso se limpian entradas viejas o repetidas del heap (un reorg
+        # o un bloque fallido pueden haber vuelto a meter la misma TX)
+        vistas, vivas = set(), []
+        for entry in self.mempool_heap:
+            tx = entry[2]
+            if tx.id not in vistas and self.pending_transactions.get(tx.id) is tx:
+                vistas.add(tx.id)
+                vivas.append(entry)
+        if not vivas:
+            return False
+        peor = max(vivas)   # mayor -fee = menor fee
+        if -peor[0] >= fee:
             return False
 
-        print("✅ TX aceptada")
-        self.pending_transactions.append(tx)
-        storage.save_mempool(self.pending_transactions)  # persistir mempool
+        vivas.remove(peor)
+        heapq.heapify(vivas)
+        self.mempool_heap = vivas
+        desalojada = peor[2]
+        self.pending_transactions.pop(desalojada.id, None)
+        self._unlock_inputs(desalojada)
+        logger.info("🗑️  TX %s… desalojada de la mempool (fee %s < %s)",
+                    desalojada.id[:16], -peor[0], fee)
         return True
 
     def get_locked_utxos(self):
-        locked = set()
-        for tx in self.pending_transactions:
-            for inp in tx.inputs:
-                locked.add((inp.tx_id, inp.output_index))
-        return locked
+        """Compatibilidad: el set se mantiene incrementalmente en locked_utxos."""
+        return self.locked_utxos
+
+    def rebuild_mempool_index(self):
+        """
+        Recalcula locked_utxos y el heap de fees desde cero a partir de la
+        mempool. Se usa al cargar de disco y cuando la mempool se modifica
+        por fuera de add_transaction (expiración, reorg).
+        """
+        self.locked_utxos = set()
+        self.mempool_heap = []
+        # Copia: otros threads agregan TXs mientras se recorre
+        for tx in list(self.pending_transactions.values()):
+            self._lock_inputs(tx)
+            fee = tx.fee
+            if fee is None:
+                try:
+                    fee = tx.fee = self.get_tx_fee(tx)
+                except KeyError:
+                    fee = 0   # inputs ya gastados: se descarta al minar
+            self.mempool_heap.append((-fee, next(self._mempool_seq), tx))
+        heapq.heapify(self.mempool_heap)
+
+    def _lock_inputs(self, tx):
+        for inp in tx.inputs:
+            self.locked_utxos.add(utxo_key(inp.tx_id, inp.output_index))
+
+    def _unlock_inputs(self, tx):
+        for inp in tx.inputs:
+            self.locked_utxos.discard(utxo_key(inp.tx_id, inp.output_index))
 
     # ======================
     # MINING
@@ -116,47 +286,57 @@ class Blockchain:
     def get_tx_fee(self, tx):
         total_input = 0
         for tx_input in tx.inputs:
-            key = (tx_input.tx_id, tx_input.output_index)
+            key = utxo_key(tx_input.tx_id, tx_input.output_index)
             utxo = self.utxo_set[key]
             total_input += utxo.amount
         total_output = sum(out.amount for out in tx.outputs)
         return total_input - total_output
 
-    def mine_pending_transactions(self, miner_pubkey_pem):
-        utxo_snapshot = copy.deepcopy(self.utxo_set)
-
-        # 0. Limpiar TXs expiradas antes de minar
-        ahora = time.time()
-        antes = len(self.pending_transactions)
-        self.pending_transactions = [
-            tx for tx in self.pending_transactions
-            if ahora - tx.timestamp <= TX_EXPIRY_SECONDS
-        ]
-        expiradas = antes - len(self.pending_transactions)
+    def mine_pending_transactions(self, miner_pubkey_pem, workers=1):
+        utxo_snapshot = UTXOOverlay(self.utxo_set)
+
+        # 0. Limpiar TXs expiradas antes de minar. Sobre una copia y borrando
+        #    en el lugar: la API y los peers agregan TXs mientras tanto
+        ahora     = time.time()
+        expiradas = 0
+        for tx_id, tx in list(self.pending_transactions.items()):
+            if ahora - tx.timestamp > TX_EXPIRY_SECONDS:
+                self.pending_transactions.pop(tx_id, None)
+                self._unlock_inputs(tx)
+                expiradas += 1
         if expiradas > 0:
             print(f"🗑️  {expiradas} TXs expiradas eliminadas de la mempool")
-            storage.save_mempool(self.pending_transactions)
-
-        # 1. Seleccionar TXs por fee
-        sorted_txs = sorted(
-            self.pending_transactions,
-            key=lambda tx: self.get_tx_fee(tx),
-            reverse=True
-        )
-        selected = []
-
-        for tx in sorted_txs:
-            if len(selected) == MAX_TX_PER_BLOCK:
-                break
+            self.rebuild_mempool_index()
+            self.mark_mempool_dirty()
+
+        # 1. Seleccionar TXs por fee — se sacan del heap solo las necesarias.
+        #    Una sola pasada: verify valida y devuelve el fee a la vez.
+        selected       = []
+        elegidas       = set()
+        salteadas      = []
+        fees_collected = 0
+
+        while self.mempool_heap and len(selected) < MAX_TX_PER_BLOCK:
+            entry = heapq.heappop(self.mempool_heap)
+            tx    = entry[2]
+            if tx.id in elegidas or self.pending_transactions.get(tx.id) is not tx:
+                continue   # entrada vieja o repetida (reorg, bloque fallido)
             try:
-                tx.verify(utxo_snapshot)
+                # Re-verificar: un reorg puede haber gastado sus inputs.
+                # Las firmas ya se verificaron al entrar a la mempool.
+                fee = self._check_tx(tx, utxo_snapshot)
             except Exception:
+                salteadas.append(entry)
                 continue
+            tx.fee          = fee
+            fees_collected += fee
             self.apply_transaction(tx, utxo_snapshot)
             selected.append(tx)
+            elegidas.add(tx.id)
 
-        # 2. Calcular fees
-        fees_collected = sum(self.get_tx_fee(tx) for tx in selected)
+        # Las que no entraron siguen pendientes
+        for entry in salteadas:
+            heapq.heappush(self.mempool_heap, entry)
 
         # 3. Coinbase con halving
         reward      = get_mining_reward(len(self.chain))
@@ -178,20 +358,25 @@ class Blockchain:
             timestamp=time.time(),
             transactions=txs,
             previous_hash=self.get_latest_block().hash,
-            difficulty=self.difficulty
+            difficulty=self.difficulty,
+            workers=workers
         )
 
         # add_block valida y aplica
         if not self.add_block(block):
-            print("Bloque minado inválido")
+            logger.warning("Bloque minado inválido")
+            for tx in selected:
+                heapq.heappush(self.mempool_heap, (-tx.fee, next(self._mempool_seq), tx))
             return False
 
-        # Limpiar mempool de las TXs que quedaron en el bloque
+        # Limpiar mempool de las TXs que quedaron en el bloque — O(1) por TX
         for tx in selected:
-            if tx in self.pending_transactions:
-                self.pending_transactions.remove(tx)
+            self.pending_transactions.pop(tx.id, None)
+            self._unlock_inputs(tx)
 
-        storage.save_mempool(self.pending_transactions)  # persistir mempool actualizada
+        # Persistir mempool actualizada (incluye las TXs aceptadas en lote)
+        self.mark_mempool_dirty()
+        self.flush_mempool()
         return True
 
     # ======================
@@ -200,12 +385,12 @@ class Blockchain:
 
     def apply_transaction(self, tx, utxo_set):
         for tx_input in tx.inputs:
-            key = (tx_input.tx_id, tx_input.output_index)
+            key = utxo_key(tx_input.tx_id, tx_input.output_index)
             if key in utxo_set:
                 del utxo_set[key]
 
         for index, tx_output in enumerate(tx.outputs):
-            key = (tx.id, index)
+            key = utxo_key(tx.id, index)
             utxo_set[key] = tx_output
 
     # ======================
@@ -214,7 +399,7 @@ class Blockchain:
 
     def create_genesis_block(self):
         genesis_output = TxOutput(amount=1000, recipient_public_key_pem=b"genesis")
-        genesis_tx = Transaction(inputs=[], outputs=[genesis_output])
+        genesis_tx = Transaction(inputs=[], outputs=[genesis_output], version=1)
 
         # ─────────────────────────────────────────────────────────────
         # TIMESTAMP FIJO: todos los nodos deben producir el mismo
@@ -229,12 +414,24 @@ class Blockchain:
             timestamp=GENESIS_TIMESTAMP,
             transactions=[genesis_tx],
             previous_hash="0",
-            difficulty=self.difficulty
+            difficulty=self.difficulty,
+            version=1   # el génesis conserva el formato v1: su hash no puede cambiar
         )
 
         self.chain.append(block)
+        self.tx_index[genesis_tx.id] = (0, 0)
+        self.blocks_by_hash[block.hash] = block
         self.apply_transaction(genesis_tx, self.utxo_set)
 
+    def rebuild_utxo_hash(self):
+        """Recalcula el MuHash recorriendo todo el utxo_set (carga o reorg)."""
+        self.utxo_hash = MuHash.of(utxo_bytes(k, out) for k, out in self.utxo_set.items())
+
+    def add_utxo(self, key, output):
+        """Agrega un UTXO por fuera de un bloque (faucet) manteniendo el MuHash."""
+        self.utxo_set[key] = output
+        self.utxo_hash.insert(utxo_bytes(key, output))
+
     def get_latest_block(self):
         return self.chain[-1]
 
@@ -243,7 +440,7 @@ class Blockchain:
         total = 0
         for block in self.chain:
             for tx in block.transactions:
-                if hasattr(tx, "is_coinbase") and tx.is_coinbase():
+                if tx.is_coinbase():
                     total += sum(o.amount for o in tx.outputs)
         return total
 
@@ -280,55 +477,76 @@ class Blockchain:
         return nueva
 
     def validate_block(self, block) -> bool:
+        return self._validate_block(block) is not None
+
+    def _validate_block(self, block):
+        """
+        Valida el bloque contra la punta de la cadena.
+        Devuelve el UTXOOverlay con todas sus TXs aplicadas (listo para
+        commit) o None si el bloque es inválido. No toca self.utxo_set.
+        """
         latest = self.get_latest_block()
 
         if block.previous_hash != latest.hash:
-            return False
+            return None
 
         if block.index != latest.index + 1:
-            return False
+            return None
 
-        if block.calculate_hash() != block.hash:
-            return False
+        if block.version not in SUPPORTED_VERSIONS:
+            return None
 
-        genesis_difficulty = self.chain[0].difficulty
-        if not block.hash.startswith("0" * genesis_difficulty):
-            return False
+        # Un bloque mal formado de la red (index, dificultad o timestamp que
+        # no son números) rompe el armado del header o las comparaciones:
+        # es un bloque inválido, no un error que corte la sincronización
+        try:
+            if block.calculate_hash() != block.hash:
+                return None
 
-        if block.difficulty < genesis_difficulty:
-            return False
+            genesis_difficulty = self.chain[0].difficulty
+            if not meets_difficulty(block.hash_bytes, genesis_difficulty):
+                return None
 
-        # Rechazar bloques con timestamp más de 2 horas en el futuro (igual que Bitcoin)
-        if block.timestamp > time.time() + 7200:
-            return False
+            if block.difficulty < genesis_difficulty:
+                return None
+
+            # Rechazar bloques con timestamp más de 2 horas en el futuro (igual que Bitcoin)
+            if block.timestamp > time.time() + 7200:
+                return None
+        except (struct.error, TypeError, ValueError):
+            return None
 
         transactions = block.transactions
 
         if len(transactions) == 0:
-            return False
+            return None
+
+        if not all(tx.has_valid_id() for tx in transactions):
+            return None
 
         # ✅ FIX: las transacciones ya son objetos Transaction, no dicts
         coinbase = transactions[0]
         if not coinbase.is_coinbase():
-            return False
+            return None
 
-        utxo_snapshot = copy.deepcopy(self.utxo_set)
+        utxo_snapshot = UTXOOverlay(self.utxo_set)
         fees_total = 0
+        firmas     = []
+        nuevas     = []   # (tx_id, firmas) verificadas por primera vez en este bloque
 
+        # UTXOs y montos en orden; las firmas se juntan y se verifican en lote,
+        # salvo las de TXs que ya pasaron por la mempool con esas mismas firmas
         for tx in transactions[1:]:
-            # ✅ FIX: manejar tanto objetos como dicts
-            if isinstance(tx, dict):
-                tx = Transaction.from_dict(tx)
-
             try:
-                valid, fee = tx.verify(utxo_snapshot)
+                fee, tx_firmas = tx.check_inputs(utxo_snapshot)
             except Exception as e:
-                print("TX inválida en validate_block:", e)
-                return False
-
-            if not valid:
-                return False
+                logger.debug("TX inválida en validate_block: %s", e)
+                return None
 
+            tx_firmas = tuple(tx_firmas)
+            if self.validated_txs.get(tx.id) != tx_firmas:
+                firmas.extend(tx_firmas)
+                nuevas.append((tx.id, tx_firmas))
             self.apply_transaction(tx, utxo_snapshot)
             fees_total += fee
 
@@ -336,63 +554,146 @@ class Blockchain:
         expected_reward = get_mining_reward(len(self.chain))  # índice del bloque que se va a agregar
 
         if coinbase_amount != expected_reward + fees_total:
-            return False
+            return None
 
-        return True
+        # Lo caro al final: un bloque con montos inválidos no llega a verificar firmas
+        if not self._verify_signatures(firmas, [block.index] * len(firmas)):
+            return None
+        for tx_id, tx_firmas in nuevas:
+            self._remember_validated(tx_id, tx_firmas)
+
+        self.apply_transaction(coinbase, utxo_snapshot)
+        return utxo_snapshot
 
     def add_block(self, block):
-        if not self.validate_block(block):
-            print("Bloque inválido")
+        with self.chain_lock:
+            return self._add_block_locked(block)
+
+    def _add_block_locked(self, block):
+        utxo_snapshot = self._validate_block(block)
+        if utxo_snapshot is None:
+            logger.info("Bloque %s inválido", block.index)
             return False
 
-        # Aplicar todas las transacciones al UTXO set real
-        for tx in block.transactions:
-            if isinstance(tx, dict):
-                tx = Transaction.from_dict(tx)
-            self.apply_transaction(tx, self.utxo_set)
+        # Volcar al UTXO set real lo que la validación ya aplicó en el sandbox
+        added, removed = utxo_snapshot.commit()
+        for key, out in removed.items():
+            self.utxo_hash.remove(utxo_bytes(key, out))
+        for key, out in added.items():
+            self.utxo_hash.insert(utxo_bytes(key, out))
 
         self.chain.append(block)
 
-        # Indexar TXs del nuevo bloque para búsqueda O(1)
-        for tx in block.transactions:
-            if hasattr(tx, "id"):
-                self.tx_index[tx.id] = block.index
+        # Indexar el bloque y sus TXs para búsqueda O(1)
+        self.blocks_by_hash[block.hash] = block
+        for pos, tx in enumerate(block.transactions):
+            self.tx_index[tx.id] = (block.index, pos)
 
         # Ajustar dificultad si corresponde
         nueva_dificultad = self.calculate_next_difficulty()
         if nueva_dificultad != self.difficulty:
             self.difficulty = nueva_dificultad
 
-        storage.save_chain(self.chain)       # persistir cadena
-        storage.save_utxo_set(self.utxo_set) # persistir UTXOs
+        # Persistir solo lo nuevo: el bloque y el delta de UTXOs
+        storage.append_block(block)
+        self._delta_ops += len(added) + len(removed)
+        if (block.index % storage.UTXO_SNAPSHOT_INTERVAL == 0
+                or self._delta_ops > storage.UTXO_DELTA_MAX_OPS):
+            storage.save_utxo_set(self.utxo_set, height=block.index, utxo_hash=self.utxo_hash)
+            self._delta_ops = 0
+        else:
+            storage.apply_utxo_delta(block.index, added, removed)
+        self.notify_tip()
         return True
 
-    def _rebuild_tx_index(self):
-        """Reconstruye el índice tx_id → block_index desde la cadena."""
-        self.tx_index = {}
+    def notify_tip(self):
+        """
+        Despierta a quien espere en tip_cv (el miner) porque avanzó la
+        cadena o cambió la mempool. Node lo llama también tras un reorg.
+        """
+        with self.tip_cv:
+            self.tip_cv.notify_all()
+
+    def rebuild_indexes(self):
+        """
+        Reconstruye desde la cadena los índices tx_id → (block_index,
+        posición) y hash → bloque. Al cargar de disco y tras un reorg.
+        """
+        self.tx_index       = {}
+        self.blocks_by_hash = {block.hash: block for block in self.chain}
         for block in self.chain:
-            for tx in block.transactions:
-                if hasattr(tx, "id"):
-                    self.tx_index[tx.id] = block.index
+            for pos, tx in enumerate(block.transactions):
+                self.tx_index[tx.id] = (block.index, pos)
+
+    def get_block_by_hash(self, block_hash: str):
+        """Bloque de la cadena actual con ese hash, o None. O(1)."""
+        return self.blocks_by_hash.get(block_hash)
 
     def get_transaction(self, tx_id: str):
         """
         Busca una TX por ID en O(1) usando el índice.
         Devuelve (tx, block_index) o (None, None) si no existe.
         """
-        block_index = self.tx_index.get(tx_id)
-        if block_index is None:
+        loc = self.tx_index.get(tx_id)
+        if loc is None:
             return None, None
-        block = self.chain[block_index]
-        for tx in block.transactions:
-            if hasattr(tx, "id") and tx.id == tx_id:
-                return tx, block_index
-        return None, None
+        block_index, pos = loc
+        return self.chain[block_index].transactions[pos], block_index
 
     # ======================
     # CHAIN VALIDATION
     # ======================
 
+    def undo_block(self, block, utxo):
+        """
+        Deshace sobre `utxo` lo que `block` (de self.chain) le aplicó: borra
+        las salidas que creó y repone las que gastó, buscándolas con
+        tx_index. Devuelve False si alguna salida gastada no está en la
+        cadena (un UTXO del faucet, por ejemplo): entonces no se puede.
+        """
+        for tx in reversed(block.transactions):
+            for index in range(len(tx.outputs)):
+                key = utxo_key(tx.id, index)
+                if key in utxo:
+                    del utxo[key]
+            for tx_input in tx.inputs:
+                pos = self.tx_index.get(tx_input.tx_id)
+                if pos is None:
+                    return False
+                origen = self.chain[pos[0]].transactions[pos[1]]
+                if tx_input.output_index >= len(origen.outputs):
+                    return False
+                utxo[utxo_key(tx_input.tx_id, tx_input.output_index)] = \
+                    origen.outputs[tx_input.output_index]
+        return True
+
+    def rewind_utxo(self, height):
+        """
+        UTXO set como estaba justo antes de self.chain[height], armado como
+        un UTXOOverlay sobre el actual: se deshacen solo los bloques de
+        height en adelante, sin tocar self.utxo_set. En un reorg corto es
+        mucho menos que rebuild_utxo_set desde el génesis. Devuelve None si
+        algún bloque no se puede deshacer (ver undo_block).
+        """
+        utxo = UTXOOverlay(self.utxo_set)
+        for block in reversed(self.chain[height:]):
+            if not self.undo_block(block, utxo):
+                return None
+        return utxo
+
+    def commit_utxo(self, overlay):
+        """
+        Vuelca un overlay (de rewind_utxo + bloques nuevos) sobre el UTXO
+        set real, actualizando el MuHash solo con lo que cambió.
+        """
+        # Una key borrada y vuelta a crear (TX en las dos ramas) pisa a la vieja
+        pisadas = {key: self.utxo_set[key] for key in overlay.overlay if key in self.utxo_set}
+        added, removed = overlay.commit()
+        for key, out in itertools.chain(removed.items(), pisadas.items()):
+            self.utxo_hash.remove(utxo_bytes(key, out))
+        for key, out in added.items():
+            self.utxo_hash.insert(utxo_bytes(key, out))
+
     def rebuild_utxo_set(self, chain=None):
         """
         Recorre una cadena de bloques desde el génesis y reconstruye
@@ -402,7 +703,7 @@ class Blockchain:
           chain — lista de bloques a recorrer. Si es None usa self.chain.
 
         Devuelve:
-          dict {(tx_id, index): TxOutput} con todos los UTXOs no gastados.
+          dict {utxo_key(tx_id, index): TxOutput} con todos los UTXOs no gastados.
 
         Este método es la fuente de verdad del estado: dado cualquier cadena
         válida, rebuild_utxo_set() siempre produce el mismo UTXO set.
@@ -414,19 +715,26 @@ class Blockchain:
 
         for block in chain:
             for tx in block.transactions:
-                if isinstance(tx, dict):
-                    tx = Transaction.from_dict(tx)
                 self.apply_transaction(tx, utxo)
 
         return utxo
 
-    def validate_chain(self, chain=None):
+    def validate_chain(self, chain=None, workers=None, full=False, utxo=None, start=0):
         """
         Valida una cadena de bloques completa desde el génesis.
         No modifica self.utxo_set ni ningún otro estado interno.
 
         Parámetros:
-          chain — lista de bloques a validar. Si es None usa self.chain.
+          chain   — lista de bloques a validar. Si es None usa self.chain.
+          workers — procesos para verificar firmas (None = uno por CPU).
+          full    — forzar la validación completa también sobre self.chain.
+          utxo    — dict vacío donde se va armando el UTXO set. Si la cadena
+                    es válida queda igual a rebuild_utxo_set(chain): así el
+                    que adopta la cadena no la recorre una segunda vez.
+          start   — primer bloque a validar. Con start > 0 los bloques
+                    anteriores son los nuestros (ya validados) y `utxo` debe
+                    traer el UTXO set justo antes de chain[start] — ver
+                    rewind_utxo.
 
         Qué verifica por cada bloque:
           - Hash previo correcto (encadenamiento)
@@ -434,39 +742,35 @@ class Blockchain:
           - Timestamp no retrocede
           - Coinbase en primera posición y con monto correcto
           - Todas las TXs con firmas y UTXOs válidos
+
+        Las firmas no dependen del UTXO set que evoluciona bloque a bloque,
+        así que se juntan durante la recorrida y se verifican todas al final,
+        en paralelo si son muchas. Las de TXs que ya están en validated_txs
+        con exactamente las mismas firmas no se vuelven a verificar (en un
+        reorg casi todas las TXs de la cadena nueva ya las conocíamos).
+
+        La cadena propia ya pasó por add_block bloque a bloque (UTXOs y
+        firmas incluidas), así que por defecto solo se revisan sus
+        invariantes estructurales — ver _validate_own_chain. Las cadenas
+        ajenas (fork choice) siempre se re-ejecutan completas.
         """
-        if chain is None:
+        if chain is None or chain is self.chain:
             chain = self.chain
+            if not full:
+                return self._validate_own_chain()
 
         # Reconstruimos el UTXO set localmente para validar TXs
-        utxo = {}
+        if utxo is None:
+            utxo = {}
+        firmas  = []   # (public_key_pem, signature, tx_hash)
+        bloques = []   # índice de bloque de cada firma, para reportar
 
-        for i, block in enumerate(chain):
+        for i in range(start, len(chain)):
+            block = chain[i]
 
             # ── Validaciones de encadenamiento ──
-            if i == 0:
-                if block.previous_hash != "0":
-                    print("Genesis inválido")
-                    return False
-            else:
-                prev = chain[i - 1]
-
-                if block.previous_hash != prev.hash:
-                    print(f"Bloque {i}: hash previo inválido")
-                    return False
-
-                if not block.hash.startswith("0" * block.difficulty):
-                    print(f"Bloque {i}: Proof of Work inválido")
-                    return False
-
-                if block.timestamp < prev.timestamp:
-                    print(f"Bloque {i}: timestamp inválido (retrocede)")
-                    return False
-
-                import time as _time
-                if block.timestamp > _time.time() + 7200:  # 2 horas
-                    print(f"Bloque {i}: timestamp demasiado en el futuro")
-                    return False
+            if not self._check_block_link(chain, i):
+                return False
 
             # ── Validaciones de transacciones ──
             fees_collected = 0
@@ -474,8 +778,9 @@ class Blockchain:
             coinbase_seen  = False
 
             for tx_index, tx in enumerate(block.transactions):
-                if isinstance(tx, dict):
-                    tx = Transaction.from_dict(tx)
+                if not tx.has_valid_id():
+                    print(f"Bloque {i}: TX con ID que no corresponde a su contenido")
+                    return False
 
                 if tx.is_coinbase():
                     # Génesis: permitimos múltiples coinbases de funding inicial
@@ -494,13 +799,17 @@ class Blockchain:
                     coinbase_tx   = tx
                     continue  # la aplicamos después de calcular las fees
 
-                # TX normal: verificar firmas y UTXOs
+                # TX normal: verificar UTXOs y montos; las firmas quedan pendientes
                 try:
-                    valid, fee = tx.verify(utxo)
+                    fee, tx_firmas = tx.check_inputs(utxo)
                 except Exception as e:
                     print(f"Bloque {i}: TX inválida — {e}")
                     return False
 
+                if self.validated_txs.get(tx.id) != tuple(tx_firmas):
+                    firmas.extend(tx_firmas)
+                    bloques.extend([i] * len(tx_firmas))
+
                 fees_collected += fee
                 self.apply_transaction(tx, utxo)
 
@@ -514,4 +823,105 @@ class Blockchain:
                         return False
                 self.apply_transaction(coinbase_tx, utxo)
 
+        return self._verify_signatures(firmas, bloques, workers)
+
+    def _check_block_link(self, chain, i):
+        """Encadenamiento, PoW y timestamp del bloque i respecto del anterior."""
+        block = chain[i]
+        if i == 0:
+            if block.previous_hash != "0":
+                print("Genesis inválido")
+                return False
+            return True
+
+        prev = chain[i - 1]
+
+        if block.previous_hash != prev.hash:
+            print(f"Bloque {i}: hash previo inválido")
+            return False
+
+        if not meets_difficulty(block.hash_bytes, block.difficulty):
+            print(f"Bloque {i}: Proof of Work inválido")
+            return False
+
+        if block.timestamp < prev.timestamp:
+            print(f"Bloque {i}: timestamp inválido (retrocede)")
+            return False
+
+        if block.timestamp > time.time() + 7200:  # 2 horas
+            print(f"Bloque {i}: timestamp demasiado en el futuro")
+            return False
+
+        return True
+
+    def _validate_own_chain(self):
+        """
+        Pasada estructural sobre self.chain, sin reconstruir el UTXO set
+        ni verificar firmas: encadenamiento, PoW, timestamps, IDs de TX,
+        posición de la coinbase y su monto (recompensa + fees).
+
+        Los montos de los inputs se resuelven con un índice local
+        {tx_id: outputs} armado durante la misma recorrida, así que el
+        costo es O(TXs) de operaciones baratas.
+        """
+        chain   = self.chain
+        salidas = {}   # {tx_id: [TxOutput]} de las TXs ya recorridas
+
+        for i, block in enumerate(chain):
+            if not self._check_block_link(chain, i):
+                return False
+
+            fees_collected = 0
+            coinbase_tx    = None
+
+            for tx_index, tx in enumerate(block.transactions):
+                if not tx.has_valid_id():
+                    print(f"Bloque {i}: TX con ID que no corresponde a su contenido")
+                    return False
+
+                if tx.is_coinbase():
+                    if i > 0:
+                        if tx_index != 0 or coinbase_tx is not None:
+                            print(f"Bloque {i}: coinbase fuera de posición 0 o repetida")
+                            return False
+                        coinbase_tx = tx
+                else:
+                    try:
+                        total_in = sum(salidas[inp.tx_id][inp.output_index].amount
+                                       for inp in tx.inputs)
+                    except (KeyError, IndexError):
+                        print(f"Bloque {i}: TX gasta un output inexistente")
+                        return False
+                    fees_collected += total_in - sum(out.amount for out in tx.outputs)
+
+                salidas[tx.id] = tx.outputs
+
+            if coinbase_tx is not None:
+                expected = get_mining_reward(i) + fees_collected
+                actual   = coinbase_tx.outputs[0].amount if coinbase_tx.outputs else 0
+                if actual != expected:
+                    print(f"Bloque {i}: coinbase inválida — esperado={expected}, obtenido={actual}")
+                    return False
+
+        return True
+
+    def _verify_signatures(self, firmas, bloques, workers=None):
+        """Verifica un lote de firmas, repartiéndolo entre procesos si es grande."""
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers < 2 or len(firmas) < PARALLEL_VERIFY_MIN_SIGS:
+            resultados = (verify_signature(*f) for f in firmas)
+            return self._check_signature_results(resultados, bloques)
+
+        chunksize = max(1, len(firmas) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            resultados = pool.map(verify_signature, *zip(*firmas), chunksize=chunksize)
+            return self._check_signature_results(resultados, bloques)
+
+    def _check_signature_results(self, resultados, bloques):
+        for ok, i in zip(resultados, bloques):
+            if not ok:
+                print(f"Bloque {i}: TX inválida — firma incorrecta")
+                return False
         return True
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+muhash.py — Hash multiplicativo de conjuntos (MuHash3072) para el UTXO set.
+
+Cada elemento se expande a un número de 3072 bits y el hash del conjunto
+es el producto de todos ellos módulo un primo. Agregar un UTXO multiplica,
+gastarlo divide: el orden no importa y mantener el hash al día cuesta
+O(UTXOs que cambian) por bloque en vez de recorrer el set entero.
+
+Para no calcular un inverso modular por cada borrado se guardan numerador
+y denominador por separado; la división se hace una sola vez al pedir el
+digest.
+"""
+
+import hashlib
+
+
+MODULUS      = 2 ** 3072 - 1103717   # primo, el mismo que usa Bitcoin Core
+ELEMENT_SIZE = 384                    # 3072 bits
+
+
+def _element(data: bytes) -> int:
+    """Expande `data` a un elemento del grupo multiplicativo módulo MODULUS."""
+    return int.from_bytes(hashlib.shake_256(data).digest(ELEMENT_SIZE), "little") % MODULUS
+
+
+class MuHash:
+
+    def __init__(self, numerator=1, denominator=1):
+        self.numerator   = numerator
+        self.denominator = denominator
+
+    @classmethod
+    def of(cls, items):
+        """MuHash de un iterable de bytes, calculado de cero."""
+        h = cls()
+        for data in items:
+            h.insert(data)
+        return h
+
+    def insert(self, data: bytes):
+        self.numerator = (self.numerator * _element(data)) % MODULUS
+
+    def remove(self, data: bytes):
+        self.denominator = (self.denominator * _element(data)) % MODULUS
+
+    def _normalize(self) -> int:
+        """Hace la división pendiente y deja denominador = 1."""
+        if self.denominator != 1:
+            self.numerator   = (self.numerator * pow(self.denominator, -1, MODULUS)) % MODULUS
+            self.denominator = 1
+        return self.numerator
+
+    def digest(self) -> bytes:
+        return hashlib.sha256(self._normalize().to_bytes(ELEMENT_SIZE, "little")).digest()
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+    def to_hex(self) -> str:
+        """Estado completo (no el digest) para persistir y seguir acumulando."""
+        return self._normalize().to_bytes(ELEMENT_SIZE, "big").hex()
+
+    @classmethod
+    def from_hex(cls, state: str):
+        return cls(int.from_bytes(bytes.fromhex(state), "big"))
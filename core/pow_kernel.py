@@ -0,0 +1,77 @@
+"""
+pow_kernel.py — Loop interno del Proof of Work.
+
+Todo el costo del minado está en este loop, así que está escrito para
+que el intérprete haga lo mínimo por intento: funciones ligadas a
+variables locales, chequeo de dificultad inline sobre los bytes crudos
+y el rango de nonces recorrido por range() en C.
+
+Lo usan tanto Block.mine_block como los workers de minado paralelo.
+"""
+
+import hashlib
+
+
+_sha256 = hashlib.sha256
+
+# ZERO_PREFIX[n] = n bytes en cero, precalculados para no alocar en el minado
+ZERO_PREFIX = [b"\x00" * i for i in range(33)]
+
+# Cada cuántos nonces se mira si otro worker ya encontró la solución
+STOP_CHECK_INTERVAL = 4096
+
+
+def meets_difficulty(digest: bytes, difficulty: int) -> bool:
+    """
+    Chequea el PoW sobre los bytes crudos del hash: N ceros hex son
+    N // 2 bytes en cero, más el nibble alto del siguiente si N es impar.
+    Equivale a hexdigest().startswith("0" * N) sin pasar por strings.
+    """
+    full_bytes = difficulty >> 1
+    if digest[:full_bytes] != ZERO_PREFIX[full_bytes]:
+        return False
+    if difficulty & 1:
+        return (digest[full_bytes] >> 4) == 0
+    return True
+
+
+def double_sha256(*parts: bytes) -> bytes:
+    """
+    SHA256(SHA256(parts...)) alimentando las partes una por una al mismo
+    contexto, sin concatenarlas en un buffer nuevo. hashlib ya delega en
+    OpenSSL (que usa SHA-NI si el CPU lo tiene); lo que queda por ahorrar
+    es overhead de Python por llamada.
+    """
+    h = _sha256()
+    for part in parts:
+        h.update(part)
+    return _sha256(h.digest()).digest()
+
+
+def find_nonce(prefix: bytes, suffix: bytes, difficulty: int,
+               start: int = 0, stride: int = 1, stop_event=None):
+    """
+    Busca un nonce válido recorriendo start, start+stride, start+2*stride...
+    El header hasheado es prefix + str(nonce) + suffix; el estado SHA256
+    del prefijo (midstate) se calcula una sola vez.
+
+    Devuelve (nonce, digest) o None si stop_event se levantó antes.
+    """
+    copy_midstate = _sha256(prefix).copy
+    sha256        = _sha256
+    full_bytes    = difficulty >> 1
+    zeros         = ZERO_PREFIX[full_bytes]
+    odd           = difficulty & 1
+    batch         = STOP_CHECK_INTERVAL * stride
+
+    while stop_event is None or not stop_event.is_set():
+        for nonce in range(start, start + batch, stride):
+            h = copy_midstate()
+            h.update(b"%d" % nonce)
+            h.update(suffix)
+            digest = sha256(h.digest()).digest()
+            if digest[:full_bytes] == zeros and (not odd or digest[full_bytes] < 0x10):
+                return nonce, digest
+        start += batch
+
+    return None
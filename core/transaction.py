@@ -1,18 +1,97 @@
-import hashlib
+import functools
 import json
+import struct
 import time as _time
+from core.pow_kernel import double_sha256
+from core.utxo import utxo_key
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
 
 
+# ── Versiones de TX ──────────────────────────────────────────────
+# 1: ID/firma sobre el JSON ordenado de _signable_data (TXs viejas y génesis)
+# 2: ID/firma sobre una serialización binaria de layout fijo (_signable_bytes)
+TX_VERSION = 2
+
+_U32     = struct.Struct("<I")
+_V2_HEAD = struct.Struct("<Id")     # version, timestamp
+_V2_OUT  = struct.Struct("<dI")     # amount, largo de la clave
+
+
 def _double_sha256(data: bytes) -> bytes:
     """
     Hash doble SHA256 como Bitcoin.
     Protege contra ataques de extensión de longitud (length extension attacks).
     SHA256(SHA256(data))
     """
-    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+    return double_sha256(data)
+
+
+# ── Direcciones ──────────────────────────────────────────────────
+# Una dirección es la clave pública del dueño. Las wallets nuevas usan el
+# punto comprimido SEC1 (33 bytes: 0x02/0x03 + X); las viejas usaban PEM
+# (~180 bytes), que se sigue aceptando para los UTXOs que ya existen.
+# En JSON la comprimida viaja en hex y la PEM como texto.
+
+def is_compressed_key(public_key: bytes) -> bool:
+    return len(public_key) == 33 and public_key[0] in (2, 3)
+
+
+def address_to_str(public_key) -> str:
+    """Dirección en bytes → texto para JSON/API."""
+    if isinstance(public_key, str):
+        return public_key
+    if is_compressed_key(public_key):
+        return public_key.hex()
+    return public_key.decode()
+
+
+def address_from_str(address) -> bytes:
+    """Inversa de address_to_str: acepta hex de clave comprimida o PEM."""
+    if isinstance(address, bytes):
+        return address
+    return _address_from_text(address)
+
+
+@functools.lru_cache(maxsize=1024)
+def _address_from_text(address: str) -> bytes:
+    """
+    Las mismas direcciones vuelven request tras request (/balance, /mine,
+    /fund): se convierten una vez y se comparte el mismo objeto bytes.
+    """
+    if len(address) == 66 and address[:2] in ("02", "03"):
+        try:
+            return bytes.fromhex(address)
+        except ValueError:
+            pass
+    return address.encode()
+
+
+@functools.lru_cache(maxsize=4096)
+def load_public_key(public_key_pem: bytes):
+    """
+    Parsea una clave pública (punto comprimido o PEM) una sola vez. El
+    parseo cuesta más que la verificación ECDSA en sí, y la misma
+    dirección aparece en muchos UTXOs. El cache es por proceso, así que
+    también sirve dentro de los workers de validate_chain.
+    """
+    if is_compressed_key(public_key_pem):
+        return ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256K1(), public_key_pem)
+    return serialization.load_pem_public_key(public_key_pem)
+
+
+def verify_signature(public_key_pem: bytes, signature: bytes, tx_hash: bytes) -> bool:
+    """
+    Verifica una firma ECDSA sobre tx_hash (ya doble-hasheado).
+    Solo recibe bytes, así se puede mandar a un worker de otro proceso.
+    """
+    try:
+        public_key = load_public_key(public_key_pem)
+        public_key.verify(signature, tx_hash, ec.ECDSA(Prehashed(hashes.SHA256())))
+    except Exception:
+        return False
+    return True
 
 
 def _serialize_deterministic(data: dict) -> bytes:
@@ -26,11 +105,16 @@ def _serialize_deterministic(data: dict) -> bytes:
 
 
 class Transaction:
-    def __init__(self, inputs, outputs, timestamp=None):
+    __slots__ = ("version", "inputs", "outputs", "timestamp", "_sig_hash", "id", "fee")
+
+    def __init__(self, inputs, outputs, timestamp=None, version=TX_VERSION):
+        self.version   = version
         self.inputs    = inputs
         self.outputs   = outputs
         self.timestamp = timestamp or _time.time()
+        self._sig_hash = None
         self.id        = self.calculate_id()
+        self.fee       = None   # lo completa Blockchain.add_transaction al validar
 
     def _signable_data(self) -> dict:
         """
@@ -48,54 +132,131 @@ class Transaction:
             "outputs": [
                 {
                     "amount": o.amount,
-                    "recipient": o.recipient_public_key.decode()
-                    if isinstance(o.recipient_public_key, bytes)
-                    else o.recipient_public_key
+                    "recipient": o.recipient_str
                 }
                 for o in self.outputs
             ],
             "timestamp": self.timestamp,
         }
 
+    def _signable_bytes(self) -> bytes:
+        """
+        Los mismos datos que _signable_data pero en binario con el orden de
+        los campos fijo, sin pasar por JSON (TX v2):
+
+          version u32 | timestamp f64 | #inputs u32
+          por input:  largo u32 | tx_id utf-8 | output_index u32
+          #outputs u32
+          por output: amount f64 | largo u32 | clave pública
+
+        Los campos de largo variable van con su largo adelante, así dos
+        TXs distintas nunca serializan igual.
+        """
+        parts = [_V2_HEAD.pack(self.version, self.timestamp), _U32.pack(len(self.inputs))]
+        for i in self.inputs:
+            tx_id = i.tx_id.encode()
+            parts += (_U32.pack(len(tx_id)), tx_id, _U32.pack(i.output_index))
+        parts.append(_U32.pack(len(self.outputs)))
+        for o in self.outputs:
+            pk = o.recipient_public_key
+            if isinstance(pk, str):
+                pk = pk.encode()
+            parts += (_V2_OUT.pack(o.amount, len(pk)), pk)
+        return b"".join(parts)
+
     def calculate_id(self) -> str:
         """
         ID de la TX = hex del doble SHA256 de los datos serializados.
         No incluye firmas → malleability protegida.
         Serialización determinística → IDs consistentes entre nodos.
         """
-        data  = _serialize_deterministic(self._signable_data())
-        return _double_sha256(data).hex()
+        return self.hash_for_signature().hex()
 
     def hash_for_signature(self) -> bytes:
         """
         Hash que firman los inputs.
         Igual que calculate_id pero devuelve bytes crudos para ECDSA.
+        Se calcula una sola vez: la TX no cambia después de armarla y las
+        firmas no entran en el hash. Sale del contenido, nunca del `id`
+        recibido por la red, que podría no corresponderse con la TX.
         """
-        data = _serialize_deterministic(self._signable_data())
-        return _double_sha256(data)
+        if self._sig_hash is None:
+            if self.version == 1:
+                data = _serialize_deterministic(self._signable_data())
+            elif self.version == 2:
+                data = self._signable_bytes()
+            else:
+                raise ValueError(f"Versión de TX no soportada: {self.version}")
+            self._sig_hash = _double_sha256(data)
+        return self._sig_hash
 
     def sign(self, private_key):
+        """
+        Firma todos los inputs con una sola operación ECDSA: el mensaje es
+        el mismo hash para todos, así que la firma de uno vale para los demás.
+        """
+        if not self.inputs:
+            return
         tx_hash = self.hash_for_signature()
-        for i in self.inputs:
-            i.sign(tx_hash, private_key)
+        first   = self.inputs[0]
+        first.sign(tx_hash, private_key)
+        for i in self.inputs[1:]:
+            i.signature = first.signature
+
+    def has_valid_id(self) -> bool:
+        """
+        El id que vino de afuera (from_dict) corresponde al contenido.
+        Los UTXOs se indexan por id, así que uno falso no puede entrar.
+        """
+        try:
+            return self.id == self.calculate_id()
+        except (ValueError, TypeError, AttributeError, struct.error):
+            return False
 
     def is_coinbase(self):
         return len(self.inputs) == 0
 
     def verify(self, utxo_set):
+        fee, firmas = self.check_inputs(utxo_set)
+
+        for public_key_pem, signature, tx_hash in firmas:
+            public_key = load_public_key(public_key_pem)
+
+            # ECDSA con prehashed=True porque ya aplicamos doble SHA256
+            public_key.verify(
+                signature,
+                tx_hash,
+                ec.ECDSA(Prehashed(hashes.SHA256()))
+            )
+
+        return True, fee
+
+    def check_inputs(self, utxo_set):
+        """
+        Todo lo que verify chequea salvo las firmas: UTXOs existentes,
+        montos y que no se cree dinero. Lanza excepción si algo falla.
+
+        Devuelve (fee, firmas) donde firmas es una lista de
+        (public_key_pem, signature, tx_hash) pendientes de verificar con
+        verify_signature — separadas para poder verificarlas en paralelo.
+        Todos los inputs firman el mismo hash: si dos traen la misma clave
+        y la misma firma (ver sign), se verifica una sola vez.
+        """
         if self.is_coinbase():
-            return True, 0
+            return 0, []
 
         tx_hash    = self.hash_for_signature()
         input_sum  = 0
         output_sum = sum(o.amount for o in self.outputs)
+        firmas     = []
+        vistas     = set()
 
         # Verificar que no haya overflow/underflow en outputs
         if output_sum < 0:
             raise Exception("Output negativo")
 
         for inp in self.inputs:
-            key = (inp.tx_id, inp.output_index)
+            key = utxo_key(inp.tx_id, inp.output_index)
 
             if key not in utxo_set:
                 raise Exception("UTXO inexistente")
@@ -107,32 +268,34 @@ class Transaction:
 
             input_sum += utxo.amount
 
-            # Verificar firma ECDSA con doble SHA256
-            public_key = serialization.load_pem_public_key(
+            firma = (
                 utxo.recipient_public_key
                 if isinstance(utxo.recipient_public_key, bytes)
-                else utxo.recipient_public_key.encode()
-            )
-
-            # ECDSA con prehashed=True porque ya aplicamos doble SHA256
-            public_key.verify(
+                else utxo.recipient_public_key.encode(),
                 inp.signature,
                 tx_hash,
-                ec.ECDSA(Prehashed(hashes.SHA256()))
             )
+            if firma not in vistas:
+                vistas.add(firma)
+                firmas.append(firma)
 
         if input_sum < output_sum:
             raise Exception("Creación de dinero: inputs < outputs")
 
-        return True, input_sum - output_sum
+        return input_sum - output_sum, firmas
 
     def to_dict(self):
-        return {
+        data = {
             "id":        self.id,
             "timestamp": self.timestamp,
             "inputs":    [i.to_dict() for i in self.inputs],
             "outputs":   [o.to_dict() for o in self.outputs],
         }
+        # Las TX v1 se serializan como siempre: su dict entra en el hash
+        # de los bloques v1 (génesis incluido) y no puede cambiar
+        if self.version != 1:
+            data["version"] = self.version
+        return data
 
     @staticmethod
     def from_dict(data):
@@ -141,12 +304,15 @@ class Transaction:
 
         inputs  = [TxInput.from_dict(i)  for i in data.get("inputs",  [])]
         outputs = [TxOutput.from_dict(o) for o in data.get("outputs", [])]
-        tx      = Transaction(inputs=inputs, outputs=outputs, timestamp=data.get("timestamp"))
+        tx      = Transaction(inputs=inputs, outputs=outputs, timestamp=data.get("timestamp"),
+                              version=data.get("version", 1))
         tx.id   = data["id"]
         return tx
 
 
 class TxInput:
+    __slots__ = ("tx_id", "output_index", "signature")
+
     def __init__(self, tx_id, output_index):
         self.tx_id        = tx_id
         self.output_index = output_index
@@ -175,24 +341,34 @@ class TxInput:
 
 
 class TxOutput:
+    # Sin __dict__ por instancia: el UTXO set guarda uno por output sin
+    # gastar y al reconstruirlo se crean de a millones
+    __slots__ = ("amount", "recipient_public_key", "_recipient_str")
+
     def __init__(self, amount, recipient_public_key_pem):
         if amount < 0:
             raise ValueError(f"Monto negativo no permitido: {amount}")
-        self.amount              = amount
+        self.amount               = amount
         self.recipient_public_key = recipient_public_key_pem
+        self._recipient_str       = None
+
+    @property
+    def recipient_str(self) -> str:
+        """
+        Dirección en texto, calculada una vez por output. /utxos y las
+        respuestas JSON la piden en cada GET; la clave no cambia nunca.
+        """
+        if self._recipient_str is None:
+            self._recipient_str = address_to_str(self.recipient_public_key)
+        return self._recipient_str
 
     def to_dict(self):
-        pk = self.recipient_public_key
-        if isinstance(pk, bytes):
-            pk = pk.decode()
         return {
-            "amount":              self.amount,
-            "recipient_public_key": pk,
+            "amount":               self.amount,
+            "recipient_public_key": self.recipient_str,
         }
 
     @staticmethod
     def from_dict(data):
-        pk = data["recipient_public_key"]
-        if isinstance(pk, str):
-            pk = pk.encode()
+        pk = address_from_str(data["recipient_public_key"])
         return TxOutput(amount=data["amount"], recipient_public_key_pem=pk)
\ No newline at end of file
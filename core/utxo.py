@@ -0,0 +1,168 @@
+"""
+utxo.py — Claves y vistas sobre el UTXO set.
+
+Las claves del UTXO set son 36 bytes: los 32 bytes crudos del tx_id
+(que es hex) + índice de output en 4 bytes big-endian. Un bytes contiguo
+se hashea y compara en una sola pasada, sin el overhead de una tupla
+(str, int) por entrada, y ocupa la mitad que el tx_id en texto.
+
+UTXOOverlay es un sandbox copy-on-write: las lecturas caen al UTXO set
+real, las escrituras van a un dict chico y los borrados se marcan como
+tombstones. Sirve para validar o armar un bloque sin copiar el set
+completo — el costo es proporcional a los UTXOs que el bloque toca,
+no al tamaño del set.
+
+UtxoSet es el UTXO set real: un dict que además mantiene un índice por
+dueño, así balances y selección de UTXOs de una wallet recorren solo
+sus propios outputs en vez del set entero.
+"""
+
+import struct
+
+
+def utxo_key(tx_id, index: int) -> bytes:
+    """
+    Arma la clave del UTXO set para el output `index` de la TX `tx_id`.
+    Lanza ValueError si tx_id no es hex: no puede existir un UTXO así.
+    """
+    if isinstance(tx_id, str):
+        tx_id = bytes.fromhex(tx_id)
+    return tx_id + index.to_bytes(4, "big")
+
+
+def split_utxo_key(key: bytes) -> tuple:
+    """Inversa de utxo_key: devuelve (tx_id, index)."""
+    return key[:-4].hex(), int.from_bytes(key[-4:], "big")
+
+
+def utxo_bytes(key: bytes, output) -> bytes:
+    """
+    Serialización de un UTXO (clave + monto + dueño) para el MuHash del
+    UTXO set: dos UTXOs distintos nunca dan los mismos bytes.
+    """
+    pk = output.recipient_public_key
+    if isinstance(pk, str):
+        pk = pk.encode()
+    return len(key).to_bytes(2, "big") + key + struct.pack("<d", output.amount) + pk
+
+
+class UtxoSet(dict):
+    """
+    dict {utxo_key: TxOutput} con un índice secundario por dueño:
+    by_owner = {recipient_public_key: {utxo_key: TxOutput}}, y el saldo
+    acumulado de cada dueño en balances = {recipient_public_key: monto}.
+    Toda alta/baja (incluido UTXOOverlay.commit) pasa por __setitem__,
+    __delitem__ o pop, que actualizan el índice en el mismo paso.
+    """
+
+    def __init__(self, items=()):
+        super().__init__(items)
+        self.by_owner = {}
+        self.balances = {}
+        for key, out in dict.items(self):
+            self._index(key, out)
+
+    def _index(self, key, out):
+        owner = out.recipient_public_key
+        owned = self.by_owner.get(owner)
+        if owned is None:
+            owned = self.by_owner[owner] = {}
+        owned[key] = out
+        self.balances[owner] = self.balances.get(owner, 0) + out.amount
+
+    def _unindex(self, key, out):
+        owner = out.recipient_public_key
+        owned = self.by_owner.get(owner)
+        if owned is not None and owned.pop(key, None) is not None:
+            if owned:
+                self.balances[owner] -= out.amount
+            else:
+                # Sin UTXOs el saldo es 0 exacto: no arrastrar error de floats
+                del self.by_owner[owner]
+                del self.balances[owner]
+
+    def __setitem__(self, key, out):
+        old = self.get(key)
+        if old is not None:
+            self._unindex(key, old)
+        super().__setitem__(key, out)
+        self._index(key, out)
+
+    def __delitem__(self, key):
+        out = self[key]
+        super().__delitem__(key)
+        self._unindex(key, out)
+
+    def pop(self, key, *default):
+        if key not in self:
+            return super().pop(key, *default)
+        out = super().pop(key)
+        self._unindex(key, out)
+        return out
+
+    def update(self, *args, **kwargs):
+        for key, out in dict(*args, **kwargs).items():
+            self[key] = out
+
+    def clear(self):
+        super().clear()
+        self.by_owner = {}
+        self.balances = {}
+
+    def owned_by(self, owner) -> dict:
+        """UTXOs de `owner` como {utxo_key: TxOutput}. No copiar: es el índice."""
+        if isinstance(owner, str):
+            owner = owner.encode()
+        return self.by_owner.get(owner, {})
+
+    def balance_of(self, owner):
+        """Saldo de `owner` en O(1), mantenido en cada alta/baja."""
+        if isinstance(owner, str):
+            owner = owner.encode()
+        return self.balances.get(owner, 0)
+
+
+class UTXOOverlay:
+
+    def __init__(self, base):
+        self.base       = base
+        self.overlay    = {}      # {key: TxOutput} agregados en el sandbox
+        self.tombstones = set()   # keys del base borradas en el sandbox
+
+    def __contains__(self, key):
+        if key in self.tombstones:
+            return False
+        return key in self.overlay or key in self.base
+
+    def __getitem__(self, key):
+        if key in self.tombstones:
+            raise KeyError(key)
+        if key in self.overlay:
+            return self.overlay[key]
+        return self.base[key]
+
+    def __setitem__(self, key, value):
+        self.overlay[key] = value
+        self.tombstones.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.overlay.pop(key, None)
+        if key in self.base:
+            self.tombstones.add(key)
+
+    def commit(self):
+        """
+        Vuelca los cambios del sandbox al UTXO set real en una pasada.
+        Devuelve (agregados, borrados) como dicts {key: TxOutput} — los
+        borrados con el valor que tenían — para persistirlos como delta
+        y actualizar el MuHash.
+        """
+        added   = self.overlay
+        removed = {key: self.base.pop(key) for key in self.tombstones}
+        for key, value in added.items():
+            self.base[key] = value
+        self.overlay    = {}
+        self.tombstones = set()
+        return added, removed
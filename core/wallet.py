@@ -1,6 +1,7 @@
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives import hashes, serialization
 from core.transaction import Transaction, TxInput, TxOutput
+from core.utxo import split_utxo_key
 
 
 class Wallet:
@@ -10,6 +11,17 @@ class Wallet:
         else:
             self.private_key = ec.generate_private_key(ec.SECP256K1())
             self.public_key  = self.private_key.public_key()
+        # La clave no cambia: las direcciones se serializan una sola vez.
+        # La comprimida (33 bytes) es la dirección; la PEM es la que usaban
+        # las versiones anteriores y se sigue mirando para no perder fondos.
+        self._address = self.public_key.public_bytes(
+            encoding=serialization.Encoding.X962,
+            format=serialization.PublicFormat.CompressedPoint
+        )
+        self._address_pem = self.public_key.public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
 
     def save(self, key_file):
         """Guarda la clave privada en un archivo PEM (sin password)."""
@@ -29,29 +41,40 @@ class Wallet:
         self.public_key = self.private_key.public_key()
 
     def address(self):
-        return self.public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
+        return self._address
+
+    def _owned_utxos(self, blockchain):
+        """UTXOs propios bajo la dirección comprimida y bajo la PEM legada."""
+        utxo_set = blockchain.utxo_set
+        yield from utxo_set.owned_by(self._address).items()
+        yield from utxo_set.owned_by(self._address_pem).items()
 
     def get_balance(self, blockchain):
-        balance = 0
-        for key, utxo in blockchain.utxo_set.items():
-            if utxo.recipient_public_key == self.address():
-                balance += utxo.amount
-        return balance
+        utxo_set = blockchain.utxo_set
+        return utxo_set.balance_of(self._address) + utxo_set.balance_of(self._address_pem)
 
     def select_utxos(self, blockchain, amount_needed):
-        locked   = blockchain.get_locked_utxos()
+        """
+        Elige UTXOs propios no lockeados que cubran amount_needed.
+        Primero busca uno que lo cubra exacto (TX sin vuelto); si no hay,
+        toma de mayor a menor monto: menos inputs → menos firmas que
+        verificar y una TX más chica.
+        """
+        locked     = blockchain.get_locked_utxos()
+        candidatos = [(key, utxo) for key, utxo in self._owned_utxos(blockchain)
+                      if key not in locked]
+
+        for key, utxo in candidatos:
+            if utxo.amount == amount_needed:
+                txid, idx = split_utxo_key(key)
+                return [(txid, idx, utxo)], utxo.amount
+
+        candidatos.sort(key=lambda c: c[1].amount, reverse=True)
         selected = []
         total    = 0
 
-        for (txid, idx), utxo in blockchain.utxo_set.items():
-            if utxo.recipient_public_key != self.address():
-                continue
-            if (txid, idx) in locked:
-                continue
-
+        for key, utxo in candidatos:
+            txid, idx = split_utxo_key(key)
             selected.append((txid, idx, utxo))
             total += utxo.amount
 
@@ -79,17 +102,13 @@ class Wallet:
         if change > 0:
             outputs.append(TxOutput(amount=change, recipient_public_key_pem=self.address()))
 
-        tx      = Transaction(inputs=inputs, outputs=outputs)
-        tx_hash = tx.hash_for_signature()
-        for tx_input in tx.inputs:
-            tx_input.sign(tx_hash, self.private_key)
-
+        tx = Transaction(inputs=inputs, outputs=outputs)
+        tx.sign(self.private_key)   # una firma para todos los inputs (son todos míos)
         return tx
 
     def get_utxos(self, blockchain):
-        my_pubkey = self.address()
-        utxos     = []
-        for (tx_id, out_idx), utxo in blockchain.utxo_set.items():
-            if utxo.recipient_public_key == my_pubkey:
-                utxos.append((tx_id, out_idx, utxo))
+        utxos = []
+        for key, utxo in self._owned_utxos(blockchain):
+            tx_id, out_idx = split_utxo_key(key)
+            utxos.append((tx_id, out_idx, utxo))
         return utxos
\ No newline at end of file
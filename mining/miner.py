@@ -2,28 +2,33 @@
 miner.py — Loop de minado automático con benchmark integrado.
 """
 
+import os
 import threading
 import time
+from core.transaction import address_from_str, address_to_str
 from test.logger import get_logger
 
 
 class Miner:
 
-    def __init__(self, blockchain, node, miner_address, poll_interval=0.1):
+    def __init__(self, blockchain, node, miner_address, poll_interval=0.1, workers=None):
         self.blockchain    = blockchain
         self.node          = node
-        self.miner_address = miner_address if isinstance(miner_address, bytes) \
-                             else miner_address.encode()
+        self.miner_address = address_from_str(miner_address)   # una vez, no por bloque
         self.poll_interval = poll_interval
+        # Procesos que reparten el espacio de nonces (Block.mine_block_parallel)
+        self.workers       = workers or os.cpu_count() or 1
 
         self._running = threading.Event()
         self._thread  = None
         self.log      = get_logger(node.port)
 
         # Estadísticas
-        self.blocks_mined    = 0
-        self.total_elapsed   = 0.0   # segundos totales minando
-        self.total_nonces    = 0     # nonces totales probados
+        # Tiempos en ns enteros de time.monotonic_ns(): no saltan si el
+        # reloj del sistema se ajusta (NTP) y no acumulan error de float
+        self.blocks_mined     = 0
+        self.total_elapsed_ns = 0     # ns totales minando
+        self.total_nonces     = 0     # nonces totales probados
 
     # ──────────────────────────────────────────────
     # CONTROL
@@ -57,26 +62,34 @@ class Miner:
 
     def _mining_loop(self):
         print(f"[Miner] Minero listo, dirección: "
-              f"{self.miner_address[:40].decode(errors='replace')}...")
+              f"{address_to_str(self.miner_address)[:40]}...")
 
         while True:
             self._running.wait()
 
             nonce_before = self.blockchain.get_latest_block().nonce if self.blockchain.chain else 0
-            t_start      = time.time()
+            t_start      = time.monotonic_ns()
 
-            success = self.blockchain.mine_pending_transactions(self.miner_address)
+            try:
+                success = self.blockchain.mine_pending_transactions(self.miner_address,
+                                                                    workers=self.workers)
+            except Exception as e:
+                # Un error (p. ej. de disco) no puede matar al thread minero
+                print(f"[Miner] ❌ Error minando: {e}")
+                success = False
 
-            elapsed = time.time() - t_start
+            elapsed_ns = time.monotonic_ns() - t_start
 
             if success:
                 new_block = self.blockchain.get_latest_block()
-                self.blocks_mined  += 1
-                self.total_elapsed += elapsed
-                self.total_nonces  += new_block.nonce
+                self.blocks_mined     += 1
+                self.total_elapsed_ns += elapsed_ns
+                self.total_nonces     += new_block.nonce
 
-                # Hashrate aproximado: nonces / segundos
-                hashrate = new_block.nonce / elapsed if elapsed > 0 else 0
+                # Hashrate aproximado: nonces / segundos. Con N workers cada uno
+                # recorre k, k+N, ... así que el nonce ganador ≈ total probado
+                hashrate = new_block.nonce * 1_000_000_000 // max(elapsed_ns, 1)
+                elapsed  = elapsed_ns / 1e9   # solo para mostrar
 
                 self.log.block_mined_benchmark(new_block, elapsed, hashrate)
 
@@ -88,15 +101,20 @@ class Miner:
 
                 self.node.announce_block(new_block)
             else:
-                time.sleep(self.poll_interval)
+                # En vez de dormir a ciegas: se retoma apenas llega un bloque
+                # nuevo o una TX; poll_interval queda solo como tope
+                with self.blockchain.tip_cv:
+                    self.blockchain.tip_cv.wait(timeout=self.poll_interval)
 
     # ──────────────────────────────────────────────
     # ESTADÍSTICAS Y BENCHMARK
     # ──────────────────────────────────────────────
 
     def status(self):
-        avg_time    = self.total_elapsed / self.blocks_mined if self.blocks_mined else 0
-        avg_hashrate = self.total_nonces / self.total_elapsed if self.total_elapsed > 0 else 0
+        total_sec    = self.total_elapsed_ns / 1e9
+        avg_time     = total_sec / self.blocks_mined if self.blocks_mined else 0
+        avg_hashrate = self.total_nonces * 1_000_000_000 // self.total_elapsed_ns \
+                       if self.total_elapsed_ns else 0
 
         return {
             "running":       self.is_running,
@@ -104,10 +122,11 @@ class Miner:
             "chain_length":  len(self.blockchain.chain),
             "pending_txs":   len(self.blockchain.pending_transactions),
             "difficulty":    self.blockchain.difficulty,
+            "workers":       self.workers,
             "benchmark": {
                 "avg_block_time_sec": round(avg_time, 2),
                 "avg_hashrate_hs":    round(avg_hashrate, 1),
                 "total_nonces":       self.total_nonces,
-                "total_time_sec":     round(self.total_elapsed, 1),
+                "total_time_sec":     round(total_sec, 1),
             }
         }
\ No newline at end of file
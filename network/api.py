@@ -6,15 +6,70 @@ Se corre en un thread separado para no bloquear el nodo P2P.
 """
 
 from flask import Flask, jsonify, request
+from core.transaction import Transaction, TxOutput, address_from_str
+from core.utxo import split_utxo_key, utxo_key
+from network.node import VERSION, json_loads
+from storage import storage
+import hashlib
+import json
 import time
 import collections
+import functools
+import socket
 import threading
+from urllib.parse import urlsplit
 
 
 # Rate limiting — máximo de requests por IP por ventana de tiempo
 RATE_LIMIT_REQUESTS = 60   # máximo requests
 RATE_LIMIT_WINDOW   = 60   # por esta cantidad de segundos
 
+# Las rutas /p2p/* tienen su propio cupo, aparte del de los usuarios: el
+# tráfico de fondo entre nodos (status push, anuncios de TXs y bloques) no
+# puede gastar el de la API, y en una red local todos los nodos comparten
+# la IP 127.0.0.1. Un 429 cuenta como request fallido y hace desalojar peers.
+P2P_RATE_LIMIT_REQUESTS = 6000
+
+
+def _json_body():
+    """
+    Body del request parseado directo de los bytes crudos: sin exigir
+    Content-Type ni guardar una copia del body en el request (lo que hace
+    get_json). None si viene vacío o no es JSON válido.
+    """
+    data = request.get_data(cache=False)
+    if not data:
+        return None
+    try:
+        return json_loads(data)
+    except ValueError:
+        return None
+
+
+@functools.lru_cache(maxsize=1024)
+def _resolve_host(host):
+    """IPs a las que resuelve `host` (vacío si no resuelve)."""
+    try:
+        return frozenset(info[4][0] for info in socket.getaddrinfo(host, None))
+    except OSError:
+        return frozenset()
+
+
+def _sender_matches(sender_url, remote_addr):
+    """
+    True si el host de `sender_url` es (o resuelve a) la IP de la que vino
+    el request: un peer no puede hacerse pasar por otro que está en otra IP.
+    """
+    if not isinstance(sender_url, str) or not remote_addr:
+        return False
+    try:
+        host = urlsplit(sender_url).hostname
+    except ValueError:
+        return False
+    if not host:
+        return False
+    return host == remote_addr or remote_addr in _resolve_host(host)
+
 
 def create_app(blockchain, node, miner=None):
     """
@@ -27,25 +82,27 @@ def create_app(blockchain, node, miner=None):
     # RATE LIMITING
     # ──────────────────────────────────────────────
 
-    _request_counts = collections.defaultdict(list)  # {ip: [timestamps]}
+    _request_counts = collections.defaultdict(collections.deque)  # {(ip, es_p2p): timestamps}
     _rl_lock        = threading.Lock()
 
     @app.before_request
     def rate_limit():
-        ip  = request.remote_addr
-        now = time.time()
+        es_p2p = request.path.startswith("/p2p/")
+        limite = P2P_RATE_LIMIT_REQUESTS if es_p2p else RATE_LIMIT_REQUESTS
+        clave  = (request.remote_addr, es_p2p)
+        now    = time.time()
 
         with _rl_lock:
-            _request_counts[ip] = [
-                t for t in _request_counts[ip]
-                if now - t < RATE_LIMIT_WINDOW
-            ]
-            if len(_request_counts[ip]) >= RATE_LIMIT_REQUESTS:
+            # En orden de llegada: se descartan solo los vencidos del frente
+            tiempos = _request_counts[clave]
+            while tiempos and now - tiempos[0] >= RATE_LIMIT_WINDOW:
+                tiempos.popleft()
+            if len(tiempos) >= limite:
                 return jsonify({
                     "ok":    False,
-                    "error": f"Rate limit: máximo {RATE_LIMIT_REQUESTS} requests por {RATE_LIMIT_WINDOW}s"
+                    "error": f"Rate limit: máximo {limite} requests por {RATE_LIMIT_WINDOW}s"
                 }), 429
-            _request_counts[ip].append(now)
+            tiempos.append(now)
 
     # ──────────────────────────────────────────────
     # HELPERS
@@ -57,6 +114,19 @@ def create_app(blockchain, node, miner=None):
     def err(message, status=400):
         return jsonify({"ok": False, "error": message}), status
 
+    # Un bloque confirmado no cambia: su JSON se arma una vez y se reusa
+    # (cacheado en el propio bloque, ver Block.cached_json)
+    def _api_json(block):
+        return json.dumps(_serialize_block(block), separators=(",", ":")).encode()
+
+    def _block_bytes(block):
+        return block.cached_json("api", _api_json)
+
+    def ok_raw(data_json: bytes, status=200):
+        """Como ok() pero con `data` ya serializado a JSON."""
+        body = b'{"ok":true,"data":' + data_json + b"}"
+        return app.response_class(body, status=status, mimetype="application/json")
+
     # ──────────────────────────────────────────────
     # NODO
     # ──────────────────────────────────────────────
@@ -70,6 +140,7 @@ def create_app(blockchain, node, miner=None):
             "chain_length": len(blockchain.chain),
             "pending_txs":  len(blockchain.pending_transactions),
             "utxo_count":   len(blockchain.utxo_set),
+            "utxo_hash":    blockchain.utxo_hash.hexdigest(),
         })
 
     @app.route("/connect", methods=["POST"])
@@ -78,7 +149,7 @@ def create_app(blockchain, node, miner=None):
         Conectarse a un peer.
         Body: { "host": "127.0.0.1", "port": 6001 }
         """
-        body = request.get_json()
+        body = _json_body()
         if not body:
             return err("Body JSON requerido")
         host = body.get("host")
@@ -96,26 +167,37 @@ def create_app(blockchain, node, miner=None):
 
     @app.route("/chain")
     def chain():
-        """Devuelve la cadena completa de bloques."""
-        return ok({
-            "length": len(blockchain.chain),
-            "chain":  [_serialize_block(b) for b in blockchain.chain],
-        })
+        """
+        Devuelve la cadena completa de bloques. Se manda en streaming, bloque
+        a bloque, en vez de armar un solo body gigante: el primer byte sale
+        enseguida y la memoria no crece con el largo de la cadena.
+        """
+        chain = list(blockchain.chain)   # foto fija: un bloque nuevo no la cambia a mitad
+
+        def generate():
+            yield b'{"ok":true,"data":{"length":%d,"chain":[' % len(chain)
+            for i, block in enumerate(chain):
+                if i:
+                    yield b","
+                yield _block_bytes(block)
+            yield b"]}}"
+
+        return app.response_class(generate(), mimetype="application/json")
 
     @app.route("/block/<int:index>")
     def block_by_index(index):
         """Bloque por índice. GET /block/0 → génesis."""
         if index < 0 or index >= len(blockchain.chain):
             return err(f"Bloque {index} no existe", 404)
-        return ok(_serialize_block(blockchain.chain[index]))
+        return ok_raw(_block_bytes(blockchain.chain[index]))
 
     @app.route("/block/hash/<hash_str>")
     def block_by_hash(hash_str):
         """Busca un bloque por su hash."""
-        for b in blockchain.chain:
-            if b.hash == hash_str:
-                return ok(_serialize_block(b))
-        return err("Bloque no encontrado", 404)
+        block = blockchain.get_block_by_hash(hash_str)
+        if block is None:
+            return err("Bloque no encontrado", 404)
+        return ok_raw(_block_bytes(block))
 
     # ──────────────────────────────────────────────
     # TRANSACCIONES
@@ -126,7 +208,7 @@ def create_app(blockchain, node, miner=None):
         """Transacciones pendientes de ser minadas."""
         return ok({
             "count":        len(blockchain.pending_transactions),
-            "transactions": [_serialize_tx(tx) for tx in blockchain.pending_transactions],
+            "transactions": [_serialize_tx(tx) for tx in list(blockchain.pending_transactions.values())],
         })
 
     @app.route("/transaction", methods=["POST"])
@@ -135,9 +217,7 @@ def create_app(blockchain, node, miner=None):
         Recibe una transacción ya firmada y la propaga a la red.
         Body: el dict que devuelve tx.to_dict()
         """
-        from core.transaction import Transaction
-
-        body = request.get_json()
+        body = _json_body()
         if not body:
             return err("Body JSON requerido")
         try:
@@ -153,19 +233,18 @@ def create_app(blockchain, node, miner=None):
     @app.route("/transaction/<tx_id>")
     def get_transaction(tx_id):
         """Busca una TX en la cadena (confirmada) o en la mempool (pendiente)."""
-        for block in blockchain.chain:
-            for tx in block.transactions:
-                if tx.id == tx_id:
-                    return ok({
-                        "status":      "confirmada",
-                        "block_index": block.index,
-                        "block_hash":  block.hash,
-                        "transaction": _serialize_tx(tx),
-                    })
-
-        for tx in blockchain.pending_transactions:
-            if tx.id == tx_id:
-                return ok({"status": "pendiente", "transaction": _serialize_tx(tx)})
+        tx, block_index = blockchain.get_transaction(tx_id)
+        if tx is not None:
+            return ok({
+                "status":      "confirmada",
+                "block_index": block_index,
+                "block_hash":  blockchain.chain[block_index].hash,
+                "transaction": _serialize_tx(tx),
+            })
+
+        tx = blockchain.pending_transactions.get(tx_id)
+        if tx is not None:
+            return ok({"status": "pendiente", "transaction": _serialize_tx(tx)})
 
         return err("Transacción no encontrada", 404)
 
@@ -177,15 +256,13 @@ def create_app(blockchain, node, miner=None):
     def all_utxos():
         """Lista todos los UTXOs del sistema — el estado completo del dinero."""
         utxos = []
-        for (tx_id, idx), utxo in blockchain.utxo_set.items():
-            pk = utxo.recipient_public_key
-            if isinstance(pk, bytes):
-                pk = pk.decode(errors="replace")
+        for key, utxo in blockchain.utxo_set.items():
+            tx_id, idx = split_utxo_key(key)
             utxos.append({
                 "tx_id":  tx_id,
                 "index":  idx,
                 "amount": utxo.amount,
-                "owner":  pk,
+                "owner":  utxo.recipient_str,
             })
         return ok({"count": len(utxos), "utxos": utxos})
 
@@ -193,24 +270,25 @@ def create_app(blockchain, node, miner=None):
     def balance():
         """
         Balance de una wallet.
-        Body: { "address": "-----BEGIN PUBLIC KEY-----\\n..." }
+        Body: { "address": "02ab…" }  (hex de la clave comprimida, o PEM legado)
         """
-        body = request.get_json()
+        body = _json_body()
         if not body or "address" not in body:
             return err("Falta campo: address")
 
         address = body["address"]
-        if isinstance(address, str):
-            address = address.encode()
+        address = address_from_str(address)
 
-        total = 0
         utxos = []
-        for (tx_id, idx), utxo in blockchain.utxo_set.items():
-            if utxo.recipient_public_key == address:
-                total += utxo.amount
-                utxos.append({"tx_id": tx_id, "index": idx, "amount": utxo.amount})
+        for key, utxo in blockchain.utxo_set.owned_by(address).items():
+            tx_id, idx = split_utxo_key(key)
+            utxos.append({"tx_id": tx_id, "index": idx, "amount": utxo.amount})
 
-        return ok({"balance": total, "utxo_count": len(utxos), "utxos": utxos})
+        return ok({
+            "balance":    blockchain.utxo_set.balance_of(address),
+            "utxo_count": len(utxos),
+            "utxos":      utxos,
+        })
 
     # ──────────────────────────────────────────────
     # MINADO
@@ -220,17 +298,16 @@ def create_app(blockchain, node, miner=None):
     def mine():
         """
         Mina un bloque con las TXs pendientes y lo anuncia a la red.
-        Body: { "miner_address": "-----BEGIN PUBLIC KEY-----\\n..." }
+        Body: { "miner_address": "02ab…" }  (hex de la clave comprimida, o PEM legado)
         """
-        body = request.get_json()
+        body = _json_body()
         if not body:
             return err("Body JSON requerido")
 
         miner_address = body.get("miner_address")
         if not miner_address:
             return err("Falta campo: miner_address")
-        if isinstance(miner_address, str):
-            miner_address = miner_address.encode()
+        miner_address = address_from_str(miner_address)
 
         success = blockchain.mine_pending_transactions(miner_address)
         if not success:
@@ -287,9 +364,9 @@ def create_app(blockchain, node, miner=None):
         """
         Inyecta coins directamente en el UTXO set (faucet de testing).
         NO modifica el génesis ni ningún bloque — solo el UTXO set en memoria.
-        Body: { "address": "-----BEGIN PUBLIC KEY-----...", "amount": 1000 }
+        Body: { "address": "02ab…", "amount": 1000 }  (clave comprimida en hex, o PEM legado)
         """
-        body = request.get_json()
+        body = _json_body()
         if not body:
             return err("Body JSON requerido")
 
@@ -298,25 +375,19 @@ def create_app(blockchain, node, miner=None):
 
         if not address:
             return err("Falta campo: address")
-        if isinstance(address, str):
-            address = address.encode()
-
-        from core.transaction import Transaction, TxOutput
-        import hashlib
-        import time as _time
+        address = address_from_str(address)
 
         tx_out = TxOutput(amount=amount, recipient_public_key_pem=address)
         tx     = Transaction(inputs=[], outputs=[tx_out])
         # ID único basado en timestamp para evitar colisiones
         tx.id  = hashlib.sha256(
-            f"fund-{_time.time()}-{address[:20]}".encode()
+            f"fund-{time.time()}-{address[:20]}".encode()
         ).hexdigest()
 
         # Solo inyectar en el UTXO set — NO tocar bloques ya minados
-        blockchain.utxo_set[(tx.id, 0)] = tx_out
-
-        from storage import storage
-        storage.save_utxo_set(blockchain.utxo_set)
+        blockchain.add_utxo(utxo_key(tx.id, 0), tx_out)
+        storage.save_utxo_set(blockchain.utxo_set, height=len(blockchain.chain) - 1,
+                              utxo_hash=blockchain.utxo_hash)
 
         return ok({"tx_id": tx.id, "amount": amount}, 201)
 
@@ -326,6 +397,7 @@ def create_app(blockchain, node, miner=None):
 
     def _serialize_block(block):
         return {
+            "version":       block.version,
             "index":         block.index,
             "hash":          block.hash,
             "previous_hash": block.previous_hash,
@@ -347,10 +419,10 @@ def create_app(blockchain, node, miner=None):
 
         outputs = []
         for out in tx.outputs:
-            pk = out.recipient_public_key
-            if isinstance(pk, bytes):
-                pk = pk.decode(errors="replace")
-            outputs.append({"amount": out.amount, "recipient_public_key": pk})
+            outputs.append({
+                "amount":               out.amount,
+                "recipient_public_key": out.recipient_str,
+            })
 
         return {
             "id":          tx.id,
@@ -368,31 +440,79 @@ def register_p2p_routes(app, blockchain, node):
 
     @app.route("/p2p/handshake", methods=["POST"])
     def p2p_handshake():
-        payload = request.get_json() or {}
+        payload = _json_body() or {}
         node.handle_handshake(payload)
         return jsonify({
             "ok":           True,
             "url":          node.public_url,
             "port":         node.port,
-            "version":      "0.2",
+            "version":      VERSION,
+            "node_id":      node.node_id_hex,
             "chain_length": len(blockchain.chain),
         })
 
+    @app.route("/p2p/status_push", methods=["POST"])
+    def p2p_status_push():
+        payload = _json_body() or {}
+        # El remitente que dice el body tiene que ser un peer y coincidir con
+        # la IP del request; si no, cualquiera pisa el estado de otro nodo
+        sender = payload.get("_sender_url")
+        if sender not in node.peers or not _sender_matches(sender, request.remote_addr):
+            return jsonify({"ok": False, "error": "Remitente no autenticado"}), 403
+        node.handle_status_push(payload)
+        return jsonify({"ok": True})
+
+    @app.route("/p2p/peers_add", methods=["POST"])
+    def p2p_peers_add():
+        payload = _json_body() or {}
+        node.handle_peers_add(payload)
+        return jsonify({"ok": True})
+
     @app.route("/p2p/block", methods=["POST"])
     def p2p_block():
-        payload = request.get_json() or {}
+        payload = _json_body() or {}
         node.handle_new_block(payload)
         return jsonify({"ok": True})
 
+    @app.route("/p2p/block_announce", methods=["POST"])
+    def p2p_block_announce():
+        payload = _json_body() or {}
+        node.handle_block_announce(payload)
+        return jsonify({"ok": True})
+
+    @app.route("/p2p/block/<block_hash>")
+    def p2p_block_get(block_hash):
+        data = node.handle_get_block(block_hash)
+        if data is None:
+            return jsonify({"error": "Bloque no encontrado"}), 404
+        return app.response_class(data, mimetype="application/json")
+
     @app.route("/p2p/tx", methods=["POST"])
     def p2p_tx():
-        payload = request.get_json() or {}
+        payload = _json_body() or {}
         node.handle_new_tx(payload)
         return jsonify({"ok": True})
 
+    @app.route("/p2p/tx_announce", methods=["POST"])
+    def p2p_tx_announce():
+        payload = _json_body() or {}
+        node.handle_tx_announce(payload)
+        return jsonify({"ok": True})
+
+    @app.route("/p2p/tx_get", methods=["POST"])
+    def p2p_tx_get():
+        payload = _json_body() or {}
+        ids     = payload.get("ids")
+        return jsonify({"txs": node.handle_get_txs(ids if isinstance(ids, list) else [])})
+
     @app.route("/p2p/chain")
     def p2p_chain():
-        return jsonify({"chain": node.handle_get_chain()})
+        """?from=N devuelve solo los bloques desde el índice N."""
+        start  = max(request.args.get("from", 0, type=int), 0)
+        length = len(blockchain.chain)
+        body   = (b'{"chain":' + node.handle_get_chain(start)
+                  + b',"from":%d,"length":%d}' % (start, length))
+        return app.response_class(body, mimetype="application/json")
 
     @app.route("/p2p/peers")
     def p2p_peers():
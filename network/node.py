@@ -8,16 +8,99 @@ Fixes en esta versión:
   4. Endpoint /network para ver todos los nodos
 """
 
+import collections
+import functools
+import hashlib
+import http.client
+import os
+import queue
 import threading
 import time
 import json
-import urllib.request
-import urllib.error
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
-VERSION = "0.2"
+from core.block import Block, meets_difficulty
+from core.transaction import Transaction
+from storage import storage
+
+try:
+    import orjson   # opcional (pip install orjson): varias veces más rápido que json
+except ImportError:
+    orjson = None
+
+VERSION = "0.11"
 
 # Versión mínima aceptada — nodos con versión menor son rechazados
-MIN_VERSION = "0.2"
+# 0.3: bloques con header binario v2 (ver core/block.py)
+# 0.4: TXs v2 con serialización binaria (ver core/transaction.py)
+# 0.5: las TXs se propagan en lotes por /p2p/txs
+# 0.6: las TXs se anuncian por ID (/p2p/tx_announce) y el peer pide solo
+#      las que no tiene (/p2p/tx_get)
+# 0.7: los peers nuevos se avisan en bloque por /p2p/peers_add
+# 0.8: cada nodo empuja su estado a sus peers por /p2p/status_push
+# 0.9: los bloques se anuncian por hash (/p2p/block_announce) y el peer
+#      pide el bloque completo solo si no lo tiene (GET /p2p/block/<hash>)
+# 0.10: los anuncios de bloques bajan por el árbol de Kadcast (`_altura`)
+# 0.11: cada nodo manda su ID de Kadcast (`node_id`) en el handshake
+MIN_VERSION = "0.11"
+
+# Propagación de TXs en lote: los IDs se juntan durante TX_FLUSH_INTERVAL
+# segundos y se manda un solo anuncio por peer con hasta TX_BATCH_MAX IDs
+TX_FLUSH_INTERVAL = 0.01
+TX_BATCH_MAX      = 100
+
+# Filtro de Bloom por peer con los IDs de TXs que ya le anunciamos o que
+# él nos anunció: esos no se le vuelven a anunciar. Un falso positivo
+# solo demora el anuncio; los filtros se vacían cada TX_BLOOM_ROTATE s.
+TX_BLOOM_BYTES  = 256
+TX_BLOOM_ROTATE = 60
+
+# Threads para todo lo que se habla con peers en segundo plano: envío de
+# bloques y lotes de TXs, handshakes, sincronización y descubrimiento.
+# Se reusan en vez de crear un thread por peer por mensaje.
+BROADCAST_WORKERS = 16
+
+# Difusión de bloques por el árbol de Kademlia (Kadcast): cada nodo tiene
+# un ID al azar que manda en el handshake y agrupa a sus peers en buckets
+# según el bit más alto de la distancia XOR. El que mina anuncia a KADCAST_BETA peers de cada
+# bucket, con altura NODE_ID_BITS; el que recibe con altura h reanuncia solo
+# a sus buckets < h, que son un subárbol que nadie más cubre. Cada nodo
+# recibe el anuncio ~β veces (no una por peer) y manda ~β·log2(N). Un nodo
+# al que no le llegó se pone al día con el bloque siguiente (ver
+# handle_new_block → sync). A un peer del que todavía no sabemos el ID se le
+# anuncia con altura 0: pide el bloque pero no lo reanuncia.
+NODE_ID_BITS = 256
+KADCAST_BETA = 2
+
+# Cada STATUS_PUSH_INTERVAL segundos el nodo manda su estado (largo de
+# cadena, UTXOs, peers) a sus peers; el mapa de red lee eso de memoria.
+# Un estado más viejo que STATUS_MAX_AGE se descarta y se consulta /status.
+STATUS_PUSH_INTERVAL = 5
+STATUS_MAX_AGE       = 3 * STATUS_PUSH_INTERVAL
+
+# Timeout de cada consulta /status del mapa de red: las consultas van en
+# paralelo, así que el mapa tarda lo que el peer más lento (con este tope)
+NETWORK_MAP_TIMEOUT = 1.5
+
+# Latencia por peer: promedio móvil exponencial (EMA) de cada request.
+# α bajo para que un request lento aislado no reordene todo; un request
+# fallido cuenta como PEER_FAIL_LATENCY. Un peer sin medir arranca en
+# PEER_DEFAULT_LATENCY (se lo prueba antes que a uno lento conocido).
+PEER_LATENCY_ALPHA   = 0.2
+PEER_DEFAULT_LATENCY = 0.1
+PEER_FAIL_LATENCY    = 5.0
+
+# Tope de peers: así el costo de cada broadcast no crece con el tamaño de
+# la red. Una URL que nadie verificó (peers_add, handshake entrante) solo
+# ocupa lugares libres; con el tope lleno se la prueba con un handshake
+# medido y entra solo si es más rápida que el peer más lento, al que
+# desplaza. Como mucho PEER_PROBE_MAX pruebas por mensaje recibido.
+MAX_PEERS      = 64
+PEER_PROBE_MAX = 8
+
+# Hashes de bloques ya procesados: un duplicado se descarta sin parsearlo
+SEEN_BLOCKS_MAX = 1024
 
 # Penalización de peers — cuántos bloques inválidos antes de desconectar
 MAX_PEER_STRIKES = 3
@@ -29,24 +112,118 @@ MAX_TIMESTAMP_DRIFT = 2 * 60 * 60
 # Todos los nodos que compartan el mismo génesis usan la misma dificultad
 
 
+@functools.lru_cache(maxsize=4096)
+def _bloom_bits(tx_id):
+    """Las dos posiciones (byte, máscara) de tx_id en un filtro de TX_BLOOM_BYTES."""
+    digest = hashlib.blake2s(tx_id.encode(), digest_size=8).digest()
+    bits   = TX_BLOOM_BYTES * 8
+    return tuple((i // 8, 1 << (i % 8))
+                 for i in (int.from_bytes(digest[:4], "big") % bits,
+                           int.from_bytes(digest[4:], "big") % bits))
+
+
+def parse_node_id(value):
+    """ID de Kadcast recibido de un peer (hex de NODE_ID_BITS bits) → int, o None."""
+    if not isinstance(value, str) or len(value) != NODE_ID_BITS // 4:
+        return None
+    try:
+        return int(value, 16)
+    except ValueError:
+        return None
+
+
+# ── HTTP con keep-alive ──────────────────────────────────────────
+# urlopen abre un socket nuevo por request: cada broadcast pagaba el
+# handshake TCP (y TLS con ngrok). Acá cada thread guarda una conexión
+# abierta por peer y la reusa. Es por thread porque HTTPConnection no
+# se puede compartir entre threads a la vez.
+
+_http_local = threading.local()
+
+
+def _http_request(method, url, body=None, timeout=5):
+    """Hace el request reusando la conexión al peer; devuelve (status, bytes)."""
+    parts = urllib.parse.urlsplit(url)
+    path  = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    key     = (parts.scheme, parts.netloc)
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+
+    conns = getattr(_http_local, "conns", None)
+    if conns is None:
+        conns = _http_local.conns = {}
+
+    for _ in range(2):
+        conn  = conns.get(key)
+        reuse = conn is not None
+        if not reuse:
+            cls  = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            conn = conns[key] = cls(parts.netloc, timeout=timeout)
+        elif conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        conn.timeout = timeout
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            res  = conn.getresponse()
+            data = res.read()
+            return res.status, data
+        except (ConnectionError, http.client.HTTPException):
+            # El peer pudo haber cerrado la conexión ociosa: se reintenta
+            # una vez con una nueva. Si la conexión ya era nueva, falla.
+            conn.close()
+            del conns[key]
+            if not reuse:
+                raise
+        except Exception:
+            conn.close()
+            del conns[key]
+            raise
+
+
+# ── JSON de la capa de red ───────────────────────────────────────
+# Con orjson si está instalado; si no, json de la stdlib con separadores
+# compactos. Los dos producen JSON que el otro lee sin problema.
+
+if orjson is not None:
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+else:
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    json_loads = json.loads
+
+
+def encode_body(body) -> bytes:
+    """JSON listo para mandar; para el mismo payload a N peers se arma una vez."""
+    return json_dumps(body)
+
+
+def _wire_json(block) -> bytes:
+    """JSON de un bloque tal como viaja por /p2p (para Block.cached_json)."""
+    return encode_body(block.to_dict())
+
+
 def http_post(url, body, timeout=5):
-    data = json.dumps(body).encode()
-    req  = urllib.request.Request(
-        url, data=data,
-        headers={"Content-Type": "application/json"},
-        method="POST"
-    )
+    """`body` puede ser un dict o bytes ya codificados con encode_body."""
+    if not isinstance(body, bytes):
+        body = encode_body(body)
     try:
-        res = urllib.request.urlopen(req, timeout=timeout)
-        return json.loads(res.read()), True
+        status, data = _http_request("POST", url, body, timeout)
+        if status >= 400:
+            return None, False
+        return json_loads(data), True
     except Exception:
         return None, False
 
 
 def http_get(url, timeout=5):
     try:
-        res = urllib.request.urlopen(url, timeout=timeout)
-        return json.loads(res.read()), True
+        status, data = _http_request("GET", url, timeout=timeout)
+        if status >= 400:
+            return None, False
+        return json_loads(data), True
     except Exception:
         return None, False
 
@@ -58,10 +235,36 @@ class Node:
         self.port       = port
         self.blockchain = blockchain
         self.public_url = f"http://127.0.0.1:{port}"
-        self.peers: set        = set()   # URLs base de peers conocidos
+        # ID de Kadcast al azar: la URL no sirve, dos nodos en hosts
+        # distintos con el mismo puerto tendrían el mismo
+        self.node_id    = int.from_bytes(os.urandom(NODE_ID_BITS // 8), "big")
+        self.node_id_hex = f"{self.node_id:0{NODE_ID_BITS // 4}x}"
+        # URLs base de peers conocidos. Copy-on-write: es un frozenset que
+        # solo se reemplaza entero bajo _lock; para leerlo alcanza con tomar
+        # la referencia (no hace falta lock, nadie lo modifica en el lugar)
+        self.peers: frozenset  = frozenset()
         self._peer_strikes: dict = {}     # {peer_url: cantidad de bloques inválidos}
+        # Un lock por grupo de estado, para que un anuncio de TXs no espere a
+        # un handshake ni a un sync: _lock cuida peers, strikes, latencias y
+        # estados empujados (cambian juntos al entrar o salir un peer)
         self._lock             = threading.Lock()
+        self._blocks_lock      = threading.Lock()   # _seen_blocks, _blocks_pedidos
+        self._tx_lock          = threading.Lock()   # _tx_pedidas, _peer_seen
+        self._sync_lock        = threading.Lock()   # _syncs
         self._running          = False
+        self._tx_outbox        = queue.Queue()   # (tx_id, peer a excluir)
+        self._tx_pedidas: set  = set()           # IDs ya pedidos a algún peer, en vuelo
+        self._blocks_pedidos: set = set()        # hashes de bloques anunciados, en vuelo
+        self._peer_seen: dict  = {}   # {peer_url: bytearray} Bloom de TXs ya conocidas por el peer
+        self._peer_seen_since  = time.monotonic()
+        self._seen_blocks      = collections.OrderedDict()   # LRU {block_hash: None}
+        self._peer_latency     = {}   # {peer_url: EMA de segundos por request}
+        self._peer_last_ok     = {}   # {peer_url: time.monotonic() del último request ok}
+        self._syncs: dict      = {}   # {peer_url: hay que repetir} de syncs en curso
+        self._peer_status: dict = {}  # {peer_url: (estado empujado, time.monotonic())}
+        self._peer_ids: dict   = {}   # {peer_url: ID de Kadcast que mandó en el handshake}
+        self._sender           = ThreadPoolExecutor(max_workers=BROADCAST_WORKERS,
+                                                    thread_name_prefix=f"p2p-{port}")
 
     # ──────────────────────────────────────────
     # ARRANCAR / DETENER
@@ -70,25 +273,25 @@ class Node:
     def start(self):
         self._running = True
         print(f"[Node:{self.port}] 🟢 Nodo HTTP arrancado en puerto {self.port}")
+        threading.Thread(target=self._tx_flush_loop, name=f"tx-outbox-{self.port}",
+                         daemon=True).start()
+        threading.Thread(target=self._status_push_loop, name=f"status-{self.port}",
+                         daemon=True).start()
         self._load_peers_from_disk()
 
     def _load_peers_from_disk(self):
         """Al arrancar intenta reconectarse a los peers conocidos del disco."""
-        from storage import storage
         peers_guardados = storage.load_peers()
         if not peers_guardados:
             return
         print(f"[Node:{self.port}] 📋 {len(peers_guardados)} peers guardados en disco, reconectando...")
         for peer_url in peers_guardados:
             if peer_url != self.public_url:
-                threading.Thread(
-                    target=self.connect_to_peer,
-                    kwargs={"peer_host": None, "peer_port": None, "peer_url": peer_url},
-                    daemon=True
-                ).start()
+                self._sender.submit(self.connect_to_peer, None, None, peer_url)
 
     def stop(self):
         self._running = False
+        self._sender.shutdown(wait=False)
         print(f"[Node:{self.port}] 🔴 Nodo detenido")
 
     # ──────────────────────────────────────────
@@ -99,23 +302,26 @@ class Node:
         if peer_url is None:
             peer_url = f"http://{peer_host}:{peer_port}"
 
-        with self._lock:
-            if peer_url in self.peers or peer_url == self.public_url:
-                return False
+        if peer_url in self.peers or peer_url == self.public_url:
+            return False
 
-        body = {"url": self.public_url, "port": self.port, "version": VERSION}
-        res, ok = http_post(f"{peer_url}/p2p/handshake", body)
+        res, ok = self._handshake(peer_url)
 
         if not ok:
             print(f"[Node:{self.port}] ❌ No pude conectar a {peer_url}")
+            with self._lock:
+                if peer_url not in self.peers:
+                    self._olvidar_peer_locked(peer_url)
             return False
 
-        with self._lock:
-            self.peers.add(peer_url)
-
         # Persistir peers en disco para reconexión sin bootstrap
-        from storage import storage
         with self._lock:
+            entro = self._add_peers_locked([peer_url],
+                                           latencia=self._peer_latency.get(peer_url))
+            if not entro:
+                if peer_url not in self.peers:
+                    self._olvidar_peer_locked(peer_url)
+                return False
             storage.save_peers(self.peers)
 
         print(f"[Node:{self.port}] ✅ Conectado a {peer_url}")
@@ -128,6 +334,25 @@ class Node:
 
         return True
 
+    def handshake_body(self):
+        return {"url": self.public_url, "port": self.port, "version": VERSION,
+                "node_id": self.node_id_hex}
+
+    def _handshake(self, peer_url, body=None):
+        """
+        Nos presentamos a peer_url y anotamos el ID de Kadcast que responde.
+        El request se mide: la latencia decide si entra con el tope lleno.
+        """
+        res, ok = self._timed_post(peer_url, "/p2p/handshake", body or self.handshake_body())
+        if ok and isinstance(res, dict):
+            self._record_peer_id(peer_url, res.get("node_id"))
+        return res, ok
+
+    def _record_peer_id(self, peer_url, value):
+        peer_id = parse_node_id(value)
+        if peer_id is not None and peer_id != self.node_id:
+            self._peer_ids[peer_url] = peer_id
+
     # ──────────────────────────────────────────
     # HANDLERS — llamados desde api.py
     # ──────────────────────────────────────────
@@ -146,21 +371,21 @@ class Node:
         if tuple(int(x) for x in peer_version.split(".")) < tuple(int(x) for x in MIN_VERSION.split(".")):
             print(f"[Node:{self.port}] ❌ Peer {peer_url} rechazado: versión {peer_version} < {MIN_VERSION}")
             return False
+        self._record_peer_id(peer_url, payload.get("node_id"))
 
         with self._lock:
             es_nuevo = peer_url not in self.peers
-            self.peers.add(peer_url)
+            entro    = es_nuevo and bool(self._add_peers_locked([peer_url]))
 
-        if es_nuevo:
+        if es_nuevo and not entro:
+            # Tope lleno: la URL que dice ser no está verificada, se la prueba
+            self._sender.submit(self._probar_candidato, peer_url, True)
+        elif es_nuevo:
             print(f"[Node:{self.port}] 🤝 Nuevo peer: {peer_url}")
 
             # FIX: avisar a TODOS los peers existentes sobre el nuevo nodo
             # y al nuevo nodo sobre todos nuestros peers
-            threading.Thread(
-                target=self._propagar_nuevo_peer,
-                args=(peer_url,),
-                daemon=True
-            ).start()
+            self._sender.submit(self._propagar_nuevo_peer, peer_url)
 
         return True
 
@@ -169,34 +394,55 @@ class Node:
         Cuando llega un peer nuevo:
         1. Le mandamos nuestra lista completa de peers (para que se conecte a todos)
         2. Avisamos a todos nuestros peers que existe el nuevo (para que se conecten)
+        Un solo POST /p2p/peers_add por lado en vez de un handshake por par.
         """
         time.sleep(0.3)
 
         # 1. Mandamos nuestro handshake al nuevo peer (conexión bidireccional)
-        body = {"url": self.public_url, "port": self.port, "version": VERSION}
-        http_post(f"{nuevo_peer_url}/p2p/handshake", body)
+        self._handshake(nuevo_peer_url)
 
-        # 2. Avisamos a todos nuestros peers sobre el nuevo
-        with self._lock:
-            peers_actuales = list(self.peers - {nuevo_peer_url})
+        peers_actuales = [p for p in self.peers if p != nuevo_peer_url]
+        if not peers_actuales:
+            return
 
+        # 2. Avisamos a todos nuestros peers sobre el nuevo, en paralelo
+        aviso = encode_body({"peers": [nuevo_peer_url]})
         for peer_url in peers_actuales:
-            # Le decimos al peer existente que hay un nodo nuevo
-            body = {"url": nuevo_peer_url, "port": 0, "version": VERSION}
-            http_post(f"{peer_url}/p2p/handshake", body)
+            self._sender.submit(http_post, f"{peer_url}/p2p/peers_add", aviso)
 
-        # 3. Le decimos al nuevo peer sobre todos nuestros peers
-        for peer_url in peers_actuales:
-            body = {"url": peer_url, "port": 0, "version": VERSION}
-            http_post(f"{nuevo_peer_url}/p2p/handshake", body)
+        # 3. Le decimos al nuevo peer sobre todos nuestros peers, de una
+        http_post(f"{nuevo_peer_url}/p2p/peers_add", {"peers": peers_actuales})
+
+    def handle_peers_add(self, payload):
+        """
+        Lista de peers que otro nodo nos avisa que existen. Se registran
+        todos con una sola toma del lock y a cada uno nuevo le mandamos
+        nuestro handshake para que la conexión quede en los dos sentidos.
+        """
+        urls = [u for u in payload.get("peers", []) if isinstance(u, str)]
+        with self._lock:
+            candidatos = [u for u in dict.fromkeys(urls)
+                          if u != self.public_url and u not in self.peers]
+            nuevos     = self._add_peers_locked(candidatos)
+
+        # Los que no entraron por el tope: se prueban (unos pocos) antes de
+        # dejarlos desplazar a un peer conocido
+        sin_lugar = [u for u in candidatos if u not in nuevos]
+        for peer_url in sin_lugar[:PEER_PROBE_MAX]:
+            self._sender.submit(self._probar_candidato, peer_url)
+
+        if not nuevos:
+            return
+        body = encode_body(self.handshake_body())
+        for peer_url in nuevos:
+            print(f"[Node:{self.port}] 🤝 Nuevo peer: {peer_url}")
+            self._sender.submit(self._handshake, peer_url, body)
 
     def handle_new_block(self, payload):
         """
         FIX: si el bloque es más nuevo que el nuestro,
         pedimos la cadena completa al remitente.
         """
-        from core.block import Block
-
         # Validar dificultad contra el génesis
         genesis_difficulty = self.blockchain.chain[0].difficulty
         block_difficulty   = payload.get("difficulty", 0)
@@ -205,14 +451,18 @@ class Node:
             return
 
         # Validar timestamp — no aceptar bloques más de 2hs en el futuro
-        import time as _time
         block_timestamp = payload.get("timestamp", 0)
-        if block_timestamp > _time.time() + MAX_TIMESTAMP_DRIFT:
+        if block_timestamp > time.time() + MAX_TIMESTAMP_DRIFT:
             print(f"[Node:{self.port}] ❌ Bloque rechazado: timestamp demasiado en el futuro")
             return
 
         sender_url = payload.get("_sender_url")
 
+        # Duplicado de un bloque que ya procesamos: nada que hacer
+        with self._blocks_lock:
+            if payload.get("hash") in self._seen_blocks:
+                return
+
         try:
             block  = Block.from_dict(payload)
             latest = self.blockchain.get_latest_block()
@@ -222,11 +472,12 @@ class Node:
                 added = self.blockchain.add_block(block)
                 if added:
                     print(f"[Node:{self.port}] 📦 Bloque #{block.index} agregado")
+                    self._mark_block_seen(block.hash)
                     # Resetear strikes del peer si mandó un bloque válido
                     if sender_url:
                         with self._lock:
                             self._peer_strikes[sender_url] = 0
-                    self.broadcast_block(block, exclude=sender_url)
+                    self._relay_block(block, payload, sender_url)
                 else:
                     print(f"[Node:{self.port}] ❌ Bloque #{block.index} inválido")
                     self._penalizar_peer(sender_url)
@@ -235,24 +486,176 @@ class Node:
                 # FIX: el bloque es más nuevo — estamos atrasados
                 # Pedir cadena al remitente y a todos los peers
                 print(f"[Node:{self.port}] 🔄 Atrasado (tengo #{latest.index}, recibí #{block.index}), sincronizando...")
+                self._relay_unseen(block, payload, sender_url)
                 if sender_url:
-                    threading.Thread(
-                        target=self._sync_chain_from,
-                        args=(sender_url,),
-                        daemon=True
-                    ).start()
+                    self._sender.submit(self._sync_chain_from, sender_url)
                 else:
-                    threading.Thread(
-                        target=self._sync_from_all,
-                        daemon=True
-                    ).start()
+                    self._sender.submit(self._sync_from_all)
+
+            elif self.blockchain.get_block_by_hash(block.hash) is not None:
+                self._mark_block_seen(block.hash)   # ya lo teníamos
 
             else:
                 print(f"[Node:{self.port}] ⚠️  Bloque #{block.index} ignorado (viejo o fork)")
+                self._relay_unseen(block, payload, sender_url)
 
         except Exception as e:
             print(f"[Node:{self.port}] ❌ Error procesando bloque: {e}")
 
+    def _relay_block(self, block, payload, sender_url):
+        """Sigue el anuncio por nuestro subárbol de Kadcast (ver broadcast_block)."""
+        altura = payload.get("_altura", NODE_ID_BITS)
+        if isinstance(altura, int) and altura > 0:
+            self.broadcast_block(block, exclude=sender_url, altura=altura)
+
+    def _relay_unseen(self, block, payload, sender_url):
+        """
+        Un bloque que no extiende nuestra punta (estamos atrasados o es de
+        otra rama) igual se reanuncia: si no, todo nuestro subárbol de
+        Kadcast se queda sin él. Se exige lo que se puede chequear sin la
+        cadena (hash y PoW) y solo la primera vez que se ve.
+        """
+        if (block.calculate_hash() != block.hash
+                or not meets_difficulty(block.hash_bytes, block.difficulty)):
+            return
+        if self._mark_block_seen(block.hash):
+            self._relay_block(block, payload, sender_url)
+
+    def handle_block_announce(self, payload):
+        """
+        Un peer anuncia un bloque por hash (ver broadcast_block). Solo si
+        no lo tenemos ni lo estamos pidiendo ya a otro se pide completo: el
+        bloque viaja una vez por nodo y no una vez por cada peer que lo anuncia.
+        """
+        sender     = payload.get("_sender_url")
+        block_hash = payload.get("hash")
+        if not sender or not isinstance(block_hash, str):
+            return
+        if self.blockchain.get_block_by_hash(block_hash) is not None:
+            return
+        with self._blocks_lock:
+            if block_hash in self._seen_blocks or block_hash in self._blocks_pedidos:
+                return
+            self._blocks_pedidos.add(block_hash)
+        self._sender.submit(self._pull_block, sender, block_hash,
+                            payload.get("_altura", NODE_ID_BITS))
+
+    def _pull_block(self, peer_url, block_hash, altura):
+        """Pide a peer_url el bloque anunciado y lo procesa como si lo hubiera empujado."""
+        try:
+            res, ok = self._timed_get(peer_url, f"/p2p/block/{block_hash}")
+            if ok and isinstance(res, dict) and res.get("hash") == block_hash:
+                res["_sender_url"] = peer_url
+                res["_altura"]     = altura
+                self.handle_new_block(res)
+        finally:
+            with self._blocks_lock:
+                self._blocks_pedidos.discard(block_hash)
+
+    def _mark_block_seen(self, block_hash):
+        """
+        Solo entran hashes de bloques válidos (al menos hash y PoW): un peer
+        no puede envenenarlo. Devuelve True si no lo habíamos visto.
+        """
+        with self._blocks_lock:
+            nuevo = block_hash not in self._seen_blocks
+            self._seen_blocks[block_hash] = None
+            self._seen_blocks.move_to_end(block_hash)
+            if len(self._seen_blocks) > SEEN_BLOCKS_MAX:
+                self._seen_blocks.popitem(last=False)
+        return nuevo
+
+    # ──────────────────────────────────────────
+    # LATENCIA DE PEERS
+    # ──────────────────────────────────────────
+
+    def _record_latency(self, peer_url, t0, ok):
+        # Sin lock: una actualización perdida entre dos threads solo corre
+        # un poco el promedio, y leer/escribir una clave del dict es atómico
+        ahora   = time.monotonic()
+        seconds = ahora - t0 if ok else PEER_FAIL_LATENCY
+        prev    = self._peer_latency.get(peer_url)
+        self._peer_latency[peer_url] = seconds if prev is None \
+            else prev + PEER_LATENCY_ALPHA * (seconds - prev)
+        if ok:
+            self._peer_last_ok[peer_url] = ahora
+
+    def _timed_post(self, peer_url, path, body, timeout=5):
+        t0      = time.monotonic()
+        res, ok = http_post(f"{peer_url}{path}", body, timeout=timeout)
+        self._record_latency(peer_url, t0, ok)
+        return res, ok
+
+    def _timed_get(self, peer_url, path, timeout=5):
+        t0      = time.monotonic()
+        res, ok = http_get(f"{peer_url}{path}", timeout=timeout)
+        self._record_latency(peer_url, t0, ok)
+        return res, ok
+
+    def _peers_by_latency(self, peers):
+        """Peers ordenados del más rápido al más lento según la EMA."""
+        latency = self._peer_latency
+        return sorted(peers, key=lambda u: latency.get(u, PEER_DEFAULT_LATENCY))
+
+    def _add_peers_locked(self, urls, latencia=None):
+        """
+        Agrega `urls` (nuevos, sin repetir) respetando MAX_PEERS. Llamar con
+        _lock tomado. Devuelve los que efectivamente entraron.
+
+        Sin `latencia` (URLs sin verificar) solo se ocupan lugares libres.
+        Con `latencia` (respondieron un handshake medido) pueden desalojar
+        a los peers más lentos que ellas, nunca a uno más rápido.
+        """
+        urls   = list(urls)
+        entran = urls[:max(0, MAX_PEERS - len(self.peers))]
+        peers  = self.peers
+        if latencia is not None and len(entran) < len(urls):
+            latency, last_ok = self._peer_latency, self._peer_last_ok
+            peor_primero = sorted(peers, key=lambda u: (latency.get(u, PEER_DEFAULT_LATENCY),
+                                                        -last_ok.get(u, 0.0)), reverse=True)
+            desalojados = []
+            for url, peor in zip(urls[len(entran):], peor_primero):
+                if latency.get(peor, PEER_DEFAULT_LATENCY) <= latencia:
+                    break
+                desalojados.append(peor)
+                entran.append(url)
+            if desalojados:
+                for url in desalojados:
+                    self._olvidar_peer_locked(url)
+                peers = peers.difference(desalojados)
+                print(f"[Node:{self.port}] ✂️  Tope de {MAX_PEERS} peers: desalojados {desalojados}")
+        if entran:
+            self.peers = peers.union(entran)
+        return entran
+
+    def _olvidar_peer_locked(self, peer_url):
+        """Borra todo lo que sabemos de peer_url (no lo saca de self.peers)."""
+        self._peer_latency.pop(peer_url, None)
+        self._peer_last_ok.pop(peer_url, None)
+        self._peer_ids.pop(peer_url, None)
+        self._peer_strikes.pop(peer_url, None)
+        self._peer_status.pop(peer_url, None)
+
+    def _probar_candidato(self, peer_url, propagar=False):
+        """
+        Con el tope lleno, una URL nueva solo entra si responde un handshake;
+        su latencia medida decide si desplaza al peer más lento.
+        """
+        res, ok = self._handshake(peer_url)
+        with self._lock:
+            if peer_url in self.peers:
+                return
+            entro = ok and self._add_peers_locked([peer_url],
+                                                  latencia=self._peer_latency.get(peer_url))
+            if not entro:
+                self._olvidar_peer_locked(peer_url)
+                return
+            storage.save_peers(self.peers)
+
+        print(f"[Node:{self.port}] 🤝 Nuevo peer: {peer_url}")
+        if propagar:
+            self._propagar_nuevo_peer(peer_url)
+
     def _penalizar_peer(self, peer_url):
         """
         Suma un strike al peer. Si supera MAX_PEER_STRIKES lo desconecta.
@@ -269,59 +672,180 @@ class Node:
         if strikes >= MAX_PEER_STRIKES:
             print(f"[Node:{self.port}] 🚫 {peer_url} baneado por bloques inválidos repetidos")
             with self._lock:
-                self.peers.discard(peer_url)
-                self._peer_strikes.pop(peer_url, None)
-            from storage import storage
-            with self._lock:
+                self.peers = self.peers - {peer_url}
+                self._olvidar_peer_locked(peer_url)
                 storage.save_peers(self.peers)
 
-    def handle_new_tx(self, payload):
-        from core.transaction import Transaction
+    def handle_new_tx(self, payload, sender=None):
         try:
             tx    = Transaction.from_dict(payload)
             added = self.blockchain.add_transaction(tx)
             if added:
                 print(f"[Node:{self.port}] 📨 TX {tx.id[:8]}... aceptada")
-                sender = payload.get("_sender_url")
-                self.broadcast_tx(tx, exclude=sender)
+                self.broadcast_tx(tx, exclude=sender or payload.get("_sender_url"))
         except Exception as e:
             print(f"[Node:{self.port}] ❌ Error procesando TX: {e}")
 
-    def handle_get_chain(self):
-        return [b.to_dict() for b in self.blockchain.chain]
+    def handle_new_txs(self, payload):
+        """Lote de TXs completas de un peer (respuesta a un /p2p/tx_get)."""
+        sender = payload.get("_sender_url")
+        for tx_data in payload.get("txs", [])[:TX_BATCH_MAX]:
+            self.handle_new_tx(tx_data, sender=sender)
+
+    def handle_tx_announce(self, payload):
+        """
+        Un peer anuncia IDs de TXs (ver _tx_flush_loop). Se piden solo las
+        que no están en la mempool, ni confirmadas, ni ya pedidas a otro:
+        en el caso común (ya la tenemos) no viaja la TX completa.
+        """
+        sender = payload.get("_sender_url")
+        if not sender:
+            return
+        pending   = self.blockchain.pending_transactions
+        confirmed = self.blockchain.tx_index
+        ids = [tx_id for tx_id in payload.get("ids", [])[:TX_BATCH_MAX]
+               if isinstance(tx_id, str)]
+        with self._tx_lock:
+            self._bloom_add(sender, ids)   # el que anuncia ya las tiene
+            faltan = [tx_id for tx_id in ids
+                      if tx_id not in pending and tx_id not in confirmed
+                      and tx_id not in self._tx_pedidas]
+            self._tx_pedidas.update(faltan)
+        if faltan:
+            self._sender.submit(self._pull_txs, sender, faltan)
+
+    def _pull_txs(self, peer_url, tx_ids):
+        """Pide a peer_url las TXs anunciadas que faltan, en un solo POST."""
+        try:
+            res, ok = self._timed_post(peer_url, "/p2p/tx_get", {"ids": tx_ids})
+            if ok and res:
+                self.handle_new_txs({"txs": res.get("txs", []), "_sender_url": peer_url})
+        finally:
+            with self._tx_lock:
+                self._tx_pedidas.difference_update(tx_ids)
+
+    def handle_get_txs(self, tx_ids):
+        """TXs de la mempool pedidas por un peer después de un anuncio."""
+        pending = self.blockchain.pending_transactions
+        txs     = (pending.get(tx_id) for tx_id in tx_ids[:TX_BATCH_MAX])
+        return [tx.to_dict() for tx in txs if tx is not None]
+
+    def handle_get_chain(self, start=0):
+        """
+        JSON (bytes) de la lista de bloques desde el índice `start`
+        (0 = cadena completa). El JSON de cada bloque se arma una vez y se
+        reusa en cada sync de cada peer (ver Block.cached_json).
+        """
+        chain = self.blockchain.chain
+        return b"[" + b",".join(self._block_bytes(block) for block in chain[start:]) + b"]"
+
+    def handle_get_block(self, block_hash):
+        """JSON (bytes) del bloque pedido tras un anuncio, o None si no lo tenemos."""
+        block = self.blockchain.get_block_by_hash(block_hash)
+        return None if block is None else self._block_bytes(block)
+
+    def _block_bytes(self, block):
+        return block.cached_json("wire", _wire_json)
 
     def handle_get_peers(self):
-        with self._lock:
-            return list(self.peers)
+        return list(self.peers)
 
     # ──────────────────────────────────────────
     # SINCRONIZACIÓN
     # ──────────────────────────────────────────
 
     def _sync_chain_from(self, peer_url):
-        """Descarga y adopta la cadena de un peer si es más larga."""
-        res, ok = http_get(f"{peer_url}/p2p/chain")
+        """
+        Sincroniza con peer_url, juntando los pedidos que llegan mientras
+        tanto: con una ráfaga de bloques nuevos del mismo peer habría un
+        sync por bloque bajando lo mismo. Si ya hay uno en curso solo se
+        marca que hay que repetir, y se repite una vez al terminar (por si
+        el pedido era por un bloque posterior al que se bajó).
+        """
+        with self._sync_lock:
+            if peer_url in self._syncs:
+                self._syncs[peer_url] = True
+                return
+            self._syncs[peer_url] = False
+        try:
+            while True:
+                self._sync_chain_once(peer_url)
+                with self._sync_lock:
+                    if not self._syncs[peer_url]:
+                        del self._syncs[peer_url]
+                        return
+                    self._syncs[peer_url] = False
+        except Exception:
+            with self._sync_lock:
+                self._syncs.pop(peer_url, None)
+            raise
+
+    def _sync_chain_once(self, peer_url):
+        """
+        Se pone al día con un peer pidiendo solo los bloques que nos faltan
+        (/p2p/chain?from=N). Si continúan nuestra punta se agregan uno por
+        uno; si no (fork), se baja la cadena completa y se adopta entera.
+        """
+        propia = len(self.blockchain.chain)
+        res, ok = self._timed_get(peer_url, f"/p2p/chain?from={propia}")
         if not ok or not res:
             return
 
         chain_data = res.get("chain", [])
+        if res.get("from", 0) == propia and chain_data:
+            if self._append_blocks(chain_data, peer_url):
+                return
+            # No encadena con nuestra punta: hace falta la cadena completa
+            res, ok = self._timed_get(peer_url, "/p2p/chain")
+            if not ok or not res:
+                return
+            chain_data = res.get("chain", [])
+
         if len(chain_data) <= len(self.blockchain.chain):
             return
 
         self._adopt_chain(chain_data, peer_url)
 
+    def _append_blocks(self, blocks_data, source_url):
+        """
+        Agrega bloques que continúan nuestra punta validando de a uno con
+        add_block (UTXOs y disco incrementales). Devuelve False si el
+        primero no encadena, para caer a la sincronización completa.
+        """
+        latest = self.blockchain.get_latest_block()
+        if blocks_data[0].get("previous_hash") != latest.hash:
+            return False
+
+        genesis_difficulty = self.blockchain.chain[0].difficulty
+        agregados = 0
+        for data in blocks_data:
+            if data.get("difficulty", 0) < genesis_difficulty:
+                print(f"[Node:{self.port}] ❌ Bloque #{data.get('index')} de {source_url}: dificultad inválida")
+                break
+            try:
+                block = Block.from_dict(data)
+            except Exception as e:
+                print(f"[Node:{self.port}] ❌ Bloque de {source_url} malformado: {e}")
+                break
+            if not self.blockchain.add_block(block):
+                print(f"[Node:{self.port}] ❌ Bloque #{block.index} de {source_url} inválido")
+                break
+            self._mark_block_seen(block.hash)
+            agregados += 1
+
+        if agregados:
+            print(f"[Node:{self.port}] ✅ {agregados} bloques agregados desde {source_url}")
+        return True
+
     def _sync_from_all(self):
-        """Sincroniza con todos los peers, adopta la cadena más larga."""
-        with self._lock:
-            peers = list(self.peers)
-        for peer_url in peers:
+        """
+        Sincroniza con todos los peers, adopta la cadena más larga. Primero
+        los más rápidos: uno caído no hace esperar a los demás su timeout.
+        """
+        for peer_url in self._peers_by_latency(self.peers):
             self._sync_chain_from(peer_url)
 
     def _adopt_chain(self, chain_data, source_url):
-        from core.block import Block
-        from core.blockchain import Blockchain
-        from storage import storage
-
         try:
             # Leer dificultad del génesis de la cadena recibida
             genesis_difficulty = chain_data[0].get("difficulty", 0)
@@ -332,69 +856,90 @@ class Node:
                 print(f"[Node:{self.port}] ❌ Cadena rechazada: génesis con dificultad distinta ({genesis_difficulty} vs {nuestro_genesis_diff})")
                 return
 
-            # Validar que todos los bloques respetan esa dificultad
-            for b in chain_data[1:]:
-                if b.get("difficulty", 0) < genesis_difficulty:
+            # Una sola pasada de parseo con los chequeos baratos (dificultad y
+            # encadenamiento): una cadena mala se corta en el primer bloque
+            # roto, antes de parsear el resto o de validar TXs y firmas
+            new_chain = []
+            for b in chain_data:
+                if new_chain and b.get("difficulty", 0) < genesis_difficulty:
                     print(f"[Node:{self.port}] ❌ Cadena rechazada: bloque con dificultad inválida")
                     return
+                block = Block.from_dict(b)
+                if new_chain and block.previous_hash != new_chain[-1].hash:
+                    print(f"[Node:{self.port}] ❌ Cadena de {source_url} inválida: bloque #{block.index} no encadena")
+                    return
+                new_chain.append(block)
+
+            # Todo el reorg con chain_lock tomado: el overlay se arma sobre el
+            # UTXO set vivo, así que un add_block (el minero, otro peer) no
+            # puede entrar entre rewind_utxo y commit_utxo
+            with self.blockchain.chain_lock:
+                if len(new_chain) <= len(self.blockchain.chain):
+                    return   # mientras esperábamos el lock la nuestra creció
+
+                # Encontrar el punto de divergencia entre la cadena vieja y la nueva
+                vieja = self.blockchain.chain
+                fork_index = 0
+                for i in range(min(len(vieja), len(new_chain))):
+                    if vieja[i].hash != new_chain[i].hash:
+                        fork_index = i
+                        break
+                else:
+                    fork_index = min(len(vieja), len(new_chain))
+
+                # Validar y armar el UTXO set en la misma recorrida. Con un
+                # prefijo común (lo normal: un reorg de 1-2 bloques) no se
+                # re-ejecuta desde el génesis: se deshacen nuestros bloques desde
+                # el fork sobre un overlay y se validan solo los bloques nuevos.
+                # Si la cadena es inválida el overlay se descarta sin más.
+                overlay = self.blockchain.rewind_utxo(fork_index) if fork_index > 0 else None
+                if overlay is not None:
+                    valida = self.blockchain.validate_chain(new_chain, utxo=overlay, start=fork_index)
+                else:
+                    rebuilt_utxo = {}
+                    valida = self.blockchain.validate_chain(new_chain, utxo=rebuilt_utxo)
+                if not valida:
+                    print(f"[Node:{self.port}] ❌ Cadena de {source_url} inválida")
+                    return
 
-            new_chain = [Block.from_dict(b) for b in chain_data]
-
-            temp_bc                      = Blockchain.__new__(Blockchain)
-            temp_bc.chain                = new_chain
-            temp_bc.utxo_set             = {}
-            temp_bc.pending_transactions = []
-            temp_bc.difficulty           = genesis_difficulty
-
-            if not temp_bc.validate_chain(new_chain):
-                print(f"[Node:{self.port}] ❌ Cadena de {source_url} inválida")
-                return
+                # ── Reorg: devolver TXs de bloques descartados a la mempool ──
+
+                # TXs que ya están confirmadas en la nueva cadena
+                txs_en_nueva = set()
+                for block in new_chain[fork_index:]:
+                    for tx in block.transactions:
+                        if not tx.is_coinbase():
+                            txs_en_nueva.add(tx.id)
+
+                # TXs de bloques descartados que no están en la nueva cadena
+                txs_recuperadas = 0
+                for block in vieja[fork_index:]:
+                    for tx in block.transactions:
+                        if not tx.is_coinbase() and tx.id not in txs_en_nueva:
+                            self.blockchain.pending_transactions[tx.id] = tx
+                            txs_recuperadas += 1
+
+                if txs_recuperadas > 0:
+                    print(f"[Node:{self.port}] ♻️  {txs_recuperadas} TXs devueltas a la mempool tras reorg")
+                    self.blockchain.mark_mempool_dirty()
+
+                # Primero el UTXO set y después la cadena: si commit_utxo
+                # falla, la cadena queda en la vieja en vez de la nueva con
+                # el UTXO set viejo
+                if overlay is not None:
+                    self.blockchain.commit_utxo(overlay)
+                else:
+                    self.blockchain.utxo_set = rebuilt_utxo
+                    self.blockchain.rebuild_utxo_hash()
+                self.blockchain.chain = new_chain
+                self.blockchain.rebuild_indexes()
+                self.blockchain.rebuild_mempool_index()
+                self.blockchain.notify_tip()
 
-            rebuilt_utxo = temp_bc.rebuild_utxo_set(new_chain)
+                print(f"[Node:{self.port}] ✅ Cadena adoptada: "
+                      f"{len(new_chain)} bloques desde {source_url} (fork en bloque #{fork_index})")
 
-            # ── Reorg: devolver TXs de bloques descartados a la mempool ──
-            # Encontrar el punto de divergencia entre la cadena vieja y la nueva
-            vieja = self.blockchain.chain
-            fork_index = 0
-            for i in range(min(len(vieja), len(new_chain))):
-                if vieja[i].hash != new_chain[i].hash:
-                    fork_index = i
-                    break
-            else:
-                fork_index = min(len(vieja), len(new_chain))
-
-            # TXs que ya están confirmadas en la nueva cadena
-            txs_en_nueva = set()
-            for block in new_chain[fork_index:]:
-                for tx in block.transactions:
-                    if isinstance(tx, dict):
-                        from core.transaction import Transaction
-                        tx = Transaction.from_dict(tx)
-                    if not tx.is_coinbase():
-                        txs_en_nueva.add(tx.id)
-
-            # TXs de bloques descartados que no están en la nueva cadena
-            txs_recuperadas = 0
-            for block in vieja[fork_index:]:
-                for tx in block.transactions:
-                    if isinstance(tx, dict):
-                        from core.transaction import Transaction
-                        tx = Transaction.from_dict(tx)
-                    if not tx.is_coinbase() and tx.id not in txs_en_nueva:
-                        self.blockchain.pending_transactions.append(tx)
-                        txs_recuperadas += 1
-
-            if txs_recuperadas > 0:
-                print(f"[Node:{self.port}] ♻️  {txs_recuperadas} TXs devueltas a la mempool tras reorg")
-                storage.save_mempool(self.blockchain.pending_transactions)
-
-            self.blockchain.chain    = new_chain
-            self.blockchain.utxo_set = rebuilt_utxo
-
-            print(f"[Node:{self.port}] ✅ Cadena adoptada: "
-                  f"{len(new_chain)} bloques desde {source_url} (fork en bloque #{fork_index})")
-
-            storage.save_all(self.blockchain)
+                storage.save_all(self.blockchain)
 
         except Exception as e:
             print(f"[Node:{self.port}] ❌ Error adoptando cadena: {e}")
@@ -406,49 +951,119 @@ class Node:
             return
 
         for url in res.get("peers", []):
+            if len(self.peers) >= MAX_PEERS:
+                break   # ya estamos en el tope: no salir a buscar más
             if url == self.public_url:
                 continue
-            with self._lock:
-                known = url in self.peers
-            if not known:
+            if url not in self.peers:
                 print(f"[Node:{self.port}] 🔍 Peer descubierto: {url}")
-                threading.Thread(
-                    target=self.connect_to_peer,
-                    kwargs={"peer_host": None, "peer_port": None, "peer_url": url},
-                    daemon=True
-                ).start()
+                self._sender.submit(self.connect_to_peer, None, None, url)
 
     # ──────────────────────────────────────────
     # BROADCAST
     # ──────────────────────────────────────────
 
-    def broadcast_block(self, block, exclude=None):
-        payload = block.to_dict()
-        payload["_sender_url"] = self.public_url
-        with self._lock:
-            peers = list(self.peers)
+    def broadcast_block(self, block, exclude=None, altura=NODE_ID_BITS):
+        """
+        Anuncia el bloque de inmediato, en paralelo, por el árbol de
+        Kadcast: a los KADCAST_BETA peers más rápidos de cada bucket por
+        debajo de `altura`, cada uno con la altura de su bucket para que
+        siga por su subárbol. Solo viaja el hash: cada peer pide el bloque
+        completo si no lo tiene (ver handle_block_announce).
+        """
+        peers = self.peers
+        if not peers or peers == {exclude}:
+            return
+        buckets = collections.defaultdict(list)
+        sin_id  = []
         for peer_url in peers:
             if peer_url == exclude:
                 continue
-            threading.Thread(
-                target=http_post,
-                args=(f"{peer_url}/p2p/block", payload),
-                daemon=True
-            ).start()
+            peer_id = self._peer_ids.get(peer_url)
+            if peer_id is None:
+                sin_id.append(peer_url)
+                continue
+            bucket = (peer_id ^ self.node_id).bit_length() - 1
+            if 0 <= bucket < altura:
+                buckets[bucket].append(peer_url)
+        for bucket, miembros in buckets.items():
+            body = encode_body({"hash": block.hash, "index": block.index,
+                                "_sender_url": self.public_url, "_altura": bucket})
+            for peer_url in self._peers_by_latency(miembros)[:KADCAST_BETA]:
+                self._sender.submit(self._timed_post, peer_url, "/p2p/block_announce", body)
+
+        # Peers sin ID conocido (todavía no hubo handshake): a todos, con
+        # altura 0 — lo piden pero no lo reanuncian
+        if sin_id:
+            body = encode_body({"hash": block.hash, "index": block.index,
+                                "_sender_url": self.public_url, "_altura": 0})
+            for peer_url in sin_id:
+                self._sender.submit(self._timed_post, peer_url, "/p2p/block_announce", body)
 
     def broadcast_tx(self, tx, exclude=None):
-        payload = tx.to_dict()
-        payload["_sender_url"] = self.public_url
-        with self._lock:
-            peers = list(self.peers)
-        for peer_url in peers:
-            if peer_url == exclude:
+        """Encola el ID; _tx_flush_loop lo anuncia junto con los demás."""
+        peers = self.peers
+        if not peers or peers == {exclude}:
+            return  # nadie a quien anunciarla
+        self._tx_outbox.put((tx.id, exclude))
+
+    def _tx_flush_loop(self):
+        """
+        Junta los IDs encolados durante TX_FLUSH_INTERVAL y manda a cada
+        peer un solo POST /p2p/tx_announce con los que no vinieron de él.
+        El peer después pide con /p2p/tx_get solo las TXs que le faltan.
+        """
+        while self._running:
+            try:
+                primera = self._tx_outbox.get(timeout=0.5)
+            except queue.Empty:
                 continue
-            threading.Thread(
-                target=http_post,
-                args=(f"{peer_url}/p2p/tx", payload),
-                daemon=True
-            ).start()
+            time.sleep(TX_FLUSH_INTERVAL)
+
+            lote = [primera]
+            while len(lote) < TX_BATCH_MAX:
+                try:
+                    lote.append(self._tx_outbox.get_nowait())
+                except queue.Empty:
+                    break
+
+            with self._tx_lock:
+                if time.monotonic() - self._peer_seen_since > TX_BLOOM_ROTATE:
+                    self._peer_seen.clear()   # así un falso positivo no dura para siempre
+                    self._peer_seen_since = time.monotonic()
+                envios = []
+                for peer_url in self.peers:
+                    ids = self._bloom_filter(peer_url, [tx_id for tx_id, exclude in lote
+                                                        if exclude != peer_url])
+                    if ids:
+                        self._bloom_add(peer_url, ids)
+                        envios.append((peer_url, tuple(ids)))
+
+            # Casi todos los peers reciben la misma lista de IDs (solo cambia
+            # para el que mandó alguna): se codifica una vez por lista distinta
+            cuerpos = {}
+            for peer_url, ids in envios:
+                body = cuerpos.get(ids)
+                if body is None:
+                    body = cuerpos[ids] = encode_body({"ids": ids, "_sender_url": self.public_url})
+                self._sender.submit(self._timed_post, peer_url, "/p2p/tx_announce", body)
+
+    def _bloom_add(self, peer_url, tx_ids):
+        """Marca tx_ids como conocidas por peer_url. Llamar con _tx_lock tomado."""
+        bloom = self._peer_seen.get(peer_url)
+        if bloom is None:
+            bloom = self._peer_seen[peer_url] = bytearray(TX_BLOOM_BYTES)
+        for tx_id in tx_ids:
+            for byte, mask in _bloom_bits(tx_id):
+                bloom[byte] |= mask
+
+    def _bloom_filter(self, peer_url, tx_ids):
+        """Los tx_ids que peer_url (probablemente) no conoce. Con _tx_lock tomado."""
+        bloom = self._peer_seen.get(peer_url)
+        if bloom is None:
+            return tx_ids
+        return [tx_id for tx_id in tx_ids
+                if not all(bloom[byte] & mask for byte, mask in _bloom_bits(tx_id))]
 
     # ──────────────────────────────────────────
     # HELPERS PARA API
@@ -461,16 +1076,50 @@ class Node:
         return added
 
     def announce_block(self, block):
+        self._mark_block_seen(block.hash)
         self.broadcast_block(block)
         print(f"[Node:{self.port}] 📢 Bloque #{block.index} anunciado")
 
+    # ──────────────────────────────────────────
+    # ESTADO DE PEERS (push)
+    # ──────────────────────────────────────────
+
+    def _status_push_loop(self):
+        """Cada STATUS_PUSH_INTERVAL manda nuestro estado a todos los peers."""
+        while self._running:
+            time.sleep(STATUS_PUSH_INTERVAL)
+            peers = self.peers
+            if not peers:
+                continue
+            body = encode_body({
+                "_sender_url":  self.public_url,
+                "url":          self.public_url,
+                "chain_length": len(self.blockchain.chain),
+                "utxo_count":   len(self.blockchain.utxo_set),
+                "peers":        list(peers),
+            })
+            for peer_url in peers:
+                self._sender.submit(self._timed_post, peer_url, "/p2p/status_push", body)
+
+    def handle_status_push(self, payload):
+        """
+        Estado que empuja un peer. Se guarda bajo el remitente
+        (`_sender_url`, como en handle_tx_announce) y solo si es un peer
+        conocido: un push no puede pisar el estado de otro nodo.
+        """
+        sender = payload.get("_sender_url")
+        if sender not in self.peers or payload.get("url", sender) != sender:
+            return
+        self._peer_status[sender] = (payload, time.monotonic())
+
     def get_network_map(self):
         """
         Devuelve un mapa de toda la red: este nodo + sus peers
         con info de cada uno (cadena, UTXOs, peers de peers).
+        Usa el estado que los peers empujan solos; solo se consulta
+        /status (en paralelo) a los que no mandaron nada reciente.
         """
-        with self._lock:
-            peers = list(self.peers)
+        peers = list(self.peers)
 
         network = [{
             "url":          self.public_url,
@@ -481,10 +1130,28 @@ class Node:
             "es_este_nodo": True,
         }]
 
+        ahora   = time.monotonic()
+        estados = {}
+        futures = {}
         for peer_url in peers:
-            res, ok = http_get(f"{peer_url}/status")
+            cached = self._peer_status.get(peer_url)
+            if cached is not None and ahora - cached[1] <= STATUS_MAX_AGE:
+                estados[peer_url] = cached[0]
+            else:
+                futures[peer_url] = self._sender.submit(self._timed_get, peer_url, "/status",
+                                                        timeout=NETWORK_MAP_TIMEOUT)
+
+        for peer_url, fut in futures.items():
+            try:
+                res, ok = fut.result(timeout=NETWORK_MAP_TIMEOUT + 0.5)
+            except Exception:
+                res, ok = None, False
             if ok and res and res.get("ok"):
-                d = res["data"]
+                estados[peer_url] = res["data"]
+
+        for peer_url in peers:
+            d = estados.get(peer_url)
+            if d is not None:
                 network.append({
                     "url":          peer_url,
                     "chain_length": d.get("chain_length", "?"),
@@ -9,11 +9,12 @@ Uso:
 Si tenés ngrok corriendo, pasá la URL pública como tercer argumento.
 """
 
+import logging
 import sys
 import threading
 import time
 import os
-import storage as storage_module
+from storage import storage as storage_module
 
 # ══════════════════════════════════════════════════════════════════
 #  CONFIGURACIÓN
@@ -24,6 +25,9 @@ import storage as storage_module
 # Si corrés todo local, dejalo en None y usá el argumento de línea de comandos.
 BOOTSTRAP_URL = "http://127.0.0.1:8000"
 
+# Threads para atender la API si está instalado waitress (pip install waitress)
+API_THREADS = 16
+
 # ══════════════════════════════════════════════════════════════════
 
 P2P_PORT     = int(sys.argv[1]) if len(sys.argv) > 1 else 6000
@@ -40,14 +44,19 @@ elif P2P_PORT != 6000:
 else:
     PEER_URL = None   # soy el bootstrap
 
+# Trazas del core (TXs/bloques rechazados, desalojos). DEBUG muestra cada TX.
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
 # Carpeta de datos separada por nodo para que varios nodos corran en la misma máquina
 storage_module.DATA_DIR = f"node_data_{P2P_PORT}"
 
-from blockchain import Blockchain
-from wallet import Wallet
-from node import Node
-from miner import Miner
-from api import create_app
+# Un solo Miner: el de mining/. Importar por paquete evita cargar dos
+# copias de los módulos (p.ej. "miner" y "mining.miner") con estado separado.
+from core.blockchain import Blockchain
+from core.wallet import Wallet
+from network.node import Node
+from mining.miner import Miner
+from network.api import create_app
 
 print(f"""
 ╔══════════════════════════════════════════╗
@@ -82,13 +91,24 @@ miner.start()
 # ── 4. API REST + P2P ────────────────────────────────────────────
 app = create_app(blockchain, node, miner)
 
-api_thread = threading.Thread(
-    target=lambda: app.run(
-        host="0.0.0.0", port=API_PORT,
-        debug=False, use_reloader=False
-    ),
-    daemon=True, name="api"
-)
+def serve_api():
+    """
+    Con waitress la API corre en un servidor WSGI de producción con un
+    pool de API_THREADS; si no está instalado, el server de Flask en modo
+    threaded (un thread por request).
+    """
+    try:
+        from waitress import serve
+    except ImportError:
+        # HTTP/1.1 para que los peers puedan reusar la conexión (keep-alive)
+        from werkzeug.serving import WSGIRequestHandler
+        WSGIRequestHandler.protocol_version = "HTTP/1.1"
+        app.run(host="0.0.0.0", port=API_PORT, debug=False, use_reloader=False, threaded=True)
+    else:
+        serve(app, host="0.0.0.0", port=API_PORT, threads=API_THREADS)
+
+
+api_thread = threading.Thread(target=serve_api, daemon=True, name="api")
 api_thread.start()
 time.sleep(1)  # esperar que Flask arranque
 
@@ -113,8 +133,14 @@ print(f"""
 
    Endpoints P2P (para otros nodos):
    POST /p2p/handshake
+   POST /p2p/peers_add
+   POST /p2p/status_push
    POST /p2p/block
+   POST /p2p/block_announce
+   GET  /p2p/block/<hash>
    POST /p2p/tx
+   POST /p2p/tx_announce
+   POST /p2p/tx_get
    GET  /p2p/chain
    GET  /p2p/peers
 
@@ -127,4 +153,5 @@ try:
 except KeyboardInterrupt:
     print("\nDeteniendo nodo...")
     miner.stop()
-    node.stop()
\ No newline at end of file
+    node.stop()
+    blockchain.flush_mempool()   # TXs aceptadas que todavía no se escribieron
\ No newline at end of file
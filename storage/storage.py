@@ -1,19 +1,58 @@
 """
 storage.py — Persistencia de la blockchain en disco.
 
-Guarda y carga tres archivos JSON:
-  - chain.json     → la cadena de bloques completa
-  - utxo_set.json  → el conjunto de UTXOs (monedas no gastadas)
-  - mempool.json   → transacciones pendientes de minar
+Archivos:
+  - chain.log       → log append-only de bloques: cada registro es el largo
+                      (4 bytes big-endian) seguido del bloque en JSON
+  - utxo_set.json   → snapshot completo del UTXO set y la altura que refleja
+  - utxo_delta.log  → una línea JSON por bloque posterior al snapshot con
+                      los UTXOs agregados y borrados
+  - mempool.json    → transacciones pendientes de minar
+
+Agregar un bloque escribe solo ese bloque y su delta de UTXOs; el snapshot
+completo se reescribe cada UTXO_SNAPSHOT_INTERVAL bloques, o antes si el log
+de deltas junta más de UTXO_DELTA_MAX_OPS operaciones.
+Los dos logs se bajan a disco (fsync) en cada agregado; si un cierre abrupto
+deja un registro a medias al final, al cargar se descarta y se corta el
+archivo ahí, para que el próximo agregado no quede pegado a esos bytes.
+Las versiones anteriores guardaban chain.json completo: se sigue leyendo
+y se migra a chain.log en la primera carga.
 """
 
 import json
 import os
+import tempfile
+import threading
+
+try:
+    import orjson   # opcional (pip install orjson): varias veces más rápido que json
+except ImportError:
+    orjson = None
 
 
 # Carpeta donde se guardan los archivos. Se crea sola si no existe.
 DATA_DIR = "blockchain_data"
 
+# Cada cuántos bloques se reescribe el snapshot del UTXO set
+UTXO_SNAPSHOT_INTERVAL = 100
+
+# Tope de operaciones (altas + bajas) acumuladas en utxo_delta.log: si un
+# tramo de bloques muy cargados lo supera, se adelanta el snapshot para que
+# el replay al arrancar siga acotado
+UTXO_DELTA_MAX_OPS = 200_000
+
+
+# JSON compacto en bytes, con orjson si está instalado. Los archivos que
+# escribe uno los lee el otro, así que instalarlo o no es indistinto.
+if orjson is not None:
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+else:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    _json_loads = json.loads
+
 
 def _ensure_dir():
     """Crea la carpeta de datos si todavía no existe."""
@@ -25,43 +64,140 @@ def _path(filename):
     return os.path.join(DATA_DIR, filename)
 
 
+# Un lock por archivo: el timer de la mempool, el minero, /fund y un reorg
+# pueden escribir el mismo archivo a la vez desde threads distintos
+_file_locks      = {}
+_file_locks_lock = threading.Lock()
+
+
+def _file_lock(filename):
+    """Lock que serializa las escrituras a `filename`."""
+    with _file_locks_lock:
+        lock = _file_locks.get(filename)
+        if lock is None:
+            lock = _file_locks[filename] = threading.Lock()
+        return lock
+
+
+def _write_atomic(filename, data: bytes):
+    """
+    Reemplaza el archivo entero de forma atómica: se escribe un temporal
+    único (mkstemp, en la misma carpeta), se baja a disco y se renombra
+    encima del original. Un corte a mitad de camino deja el archivo
+    anterior completo, nunca uno a medias; dos escrituras concurrentes
+    no comparten el temporal y además se serializan con _file_lock.
+    """
+    path = _path(filename)
+    with _file_lock(filename):
+        fd, tmp = tempfile.mkstemp(dir=DATA_DIR, prefix=filename + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+
 # ==============================================================================
 # GUARDAR
 # ==============================================================================
 
+def _block_record(block) -> bytes:
+    """Un registro de chain.log: largo en 4 bytes + JSON compacto del bloque."""
+    data = _json_dumps(block.to_dict())
+    return len(data).to_bytes(4, "big") + data
+
+
+def _utxo_key_str(utxo_k) -> str:
+    """Clave en bytes (ver core.utxo.utxo_key) → "tx_id:index" para disco."""
+    from core.utxo import split_utxo_key
+    tx_id, index = split_utxo_key(utxo_k)
+    return f"{tx_id}:{index}"             # "abc123:0"
+
+
+def _utxo_key_bytes(key_str):
+    """Inversa de _utxo_key_str."""
+    from core.utxo import utxo_key
+    # El tx_id puede contener ":" si es hex, así que separamos solo en el ÚLTIMO ":"
+    last_colon = key_str.rfind(":")
+    return utxo_key(key_str[:last_colon], int(key_str[last_colon + 1:]))
+
+
 def save_chain(chain):
     """
-    Serializa la lista de bloques a JSON y la guarda en chain.json.
-    Cada bloque se convierte con su propio to_dict().
+    Reescribe chain.log completo. Solo hace falta al crear la cadena o al
+    adoptar otra; para un bloque nuevo se usa append_block.
     """
     _ensure_dir()
-    data = [block.to_dict() for block in chain]
-
-    with open(_path("chain.json"), "w") as f:
-        json.dump(data, f, indent=2)
+    _write_atomic("chain.log", b"".join(_block_record(block) for block in chain))
 
     print(f"💾 Cadena guardada ({len(chain)} bloques)")
 
 
-def save_utxo_set(utxo_set):
+def append_block(block):
+    """Agrega un bloque al final de chain.log sin tocar los anteriores."""
+    _ensure_dir()
+    record = _block_record(block)
+    with _file_lock("chain.log"), open(_path("chain.log"), "ab") as f:
+        f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+
+    print(f"💾 Bloque #{block.index} guardado")
+
+
+def save_utxo_set(utxo_set, height=None, utxo_hash=None):
     """
-    El utxo_set tiene claves que son tuplas (tx_id, index).
-    JSON no soporta tuplas como claves, así que las convertimos
-    a strings con el formato "tx_id:index" y al cargar las separamos.
+    Escribe el snapshot completo del UTXO set y vacía el log de deltas.
+    `height` es el índice del último bloque reflejado en el snapshot
+    (None si no se conoce) y `utxo_hash` su MuHash, si se tiene.
     """
     _ensure_dir()
 
     serializable = {}
-    for (tx_id, index), utxo in utxo_set.items():
-        key = f"{tx_id}:{index}"          # "abc123:0"
-        serializable[key] = utxo.to_dict()
-
-    with open(_path("utxo_set.json"), "w") as f:
-        json.dump(serializable, f, indent=2)
+    for utxo_k, utxo in utxo_set.items():
+        serializable[_utxo_key_str(utxo_k)] = utxo.to_dict()
+
+    data = _json_dumps({
+        "height": height,
+        "muhash": utxo_hash.to_hex() if utxo_hash is not None else None,
+        "utxos":  serializable,
+    })
+
+    # Los deltas anteriores ya están incluidos en el snapshot (si se corta
+    # antes de vaciarlo, load_utxo_set saltea los que el snapshot ya cubre).
+    # Con el lock del log tomado, ningún delta se agrega entre las dos cosas
+    with _file_lock("utxo_delta.log"):
+        _write_atomic("utxo_set.json", data)
+        open(_path("utxo_delta.log"), "w").close()
 
     print(f"💾 UTXO set guardado ({len(utxo_set)} entradas)")
 
 
+def apply_utxo_delta(height, added, removed):
+    """
+    Registra en utxo_delta.log los cambios que el bloque `height` hizo
+    sobre el UTXO set: `added` es {utxo_key: TxOutput}, `removed` las
+    claves gastadas.
+    """
+    _ensure_dir()
+    entry = {
+        "height":  height,
+        "added":   {_utxo_key_str(k): out.to_dict() for k, out in added.items()},
+        "removed": [_utxo_key_str(k) for k in removed],
+    }
+    with _file_lock("utxo_delta.log"), open(_path("utxo_delta.log"), "ab") as f:
+        f.write(_json_dumps(entry) + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
 def save_mempool(pending_transactions):
     """
     Guarda las transacciones pendientes en mempool.json.
@@ -69,8 +205,7 @@ def save_mempool(pending_transactions):
     _ensure_dir()
     data = [tx.to_dict() for tx in pending_transactions]
 
-    with open(_path("mempool.json"), "w") as f:
-        json.dump(data, f, indent=2)
+    _write_atomic("mempool.json", _json_dumps(data))
 
     print(f"💾 Mempool guardada ({len(pending_transactions)} TXs)")
 
@@ -78,8 +213,11 @@ def save_mempool(pending_transactions):
 def save_all(blockchain):
     """Atajo para guardar todo de una vez."""
     save_chain(blockchain.chain)
-    save_utxo_set(blockchain.utxo_set)
-    save_mempool(blockchain.pending_transactions)
+    save_utxo_set(blockchain.utxo_set, height=len(blockchain.chain) - 1,
+                  utxo_hash=blockchain.utxo_hash)
+    # Por flush_mempool: escribe con el lock de la mempool tomado
+    blockchain.mark_mempool_dirty()
+    blockchain.flush_mempool()
 
 
 # ==============================================================================
@@ -88,11 +226,41 @@ def save_all(blockchain):
 
 def load_chain():
     """
-    Carga chain.json y reconstruye la lista de objetos Block.
-    Devuelve None si el archivo no existe (primera vez que corre el nodo).
+    Lee chain.log y reconstruye la lista de objetos Block.
+    Un registro final incompleto (corte durante la escritura) se descarta.
+    Si solo existe el chain.json de versiones anteriores, lo carga y lo
+    migra a chain.log.
+    Devuelve None si no hay nada guardado (primera vez que corre el nodo).
     """
     from core.block import Block
 
+    path = _path("chain.log")
+    if not os.path.exists(path):
+        return _migrate_legacy_chain()
+
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    chain = []
+    pos   = 0
+    while pos + 4 <= len(raw):
+        size = int.from_bytes(raw[pos:pos + 4], "big")
+        end  = pos + 4 + size
+        if end > len(raw):
+            break
+        chain.append(Block.from_dict(_json_loads(raw[pos + 4:end])))
+        pos = end
+    if pos < len(raw):
+        print("⚠️  chain.log con un registro incompleto al final, descartándolo")
+        os.truncate(path, pos)
+
+    print(f"📂 Cadena cargada ({len(chain)} bloques)")
+    return chain
+
+
+def _migrate_legacy_chain():
+    from core.block import Block
+
     path = _path("chain.json")
     if not os.path.exists(path):
         return None
@@ -101,35 +269,75 @@ def load_chain():
         data = json.load(f)
 
     chain = [Block.from_dict(block_data) for block_data in data]
-    print(f"📂 Cadena cargada ({len(chain)} bloques)")
+    print(f"📂 Cadena cargada desde chain.json ({len(chain)} bloques), migrando a chain.log")
+    save_chain(chain)
     return chain
 
 
 def load_utxo_set():
     """
-    Carga utxo_set.json y reconstruye el dict con claves (tx_id, index).
-    Devuelve None si el archivo no existe.
+    Carga el snapshot utxo_set.json y le aplica los deltas de utxo_delta.log.
+    Devuelve (utxo_set, height, utxo_hash): el dict con claves
+    utxo_key(tx_id, index), el índice del último bloque reflejado y el
+    MuHash del set, ambos None si no se conocen.
+    Devuelve (None, None, None) si no hay snapshot.
     """
+    from core.muhash import MuHash
     from core.transaction import TxOutput
+    from core.utxo import utxo_bytes
 
     path = _path("utxo_set.json")
     if not os.path.exists(path):
-        return None
+        return None, None, None
 
-    with open(path, "r") as f:
-        data = json.load(f)
+    with open(path, "rb") as f:
+        data = _json_loads(f.read())
+
+    # {"height", "muhash", "utxos"}; las versiones anteriores guardaban el dict de UTXOs solo
+    if "utxos" in data and "height" in data:
+        height    = data["height"]
+        utxo_hash = MuHash.from_hex(data["muhash"]) if data.get("muhash") else None
+        data      = data["utxos"]
+    else:
+        height, utxo_hash = None, None
 
     utxo_set = {}
     for key_str, utxo_data in data.items():
-        # Separamos "tx_id:index" → ("tx_id", index)
-        # El tx_id puede contener ":" si es hex, así que separamos solo en el ÚLTIMO ":"
-        last_colon = key_str.rfind(":")
-        tx_id = key_str[:last_colon]
-        index = int(key_str[last_colon + 1:])
-        utxo_set[(tx_id, index)] = TxOutput.from_dict(utxo_data)
+        utxo_set[_utxo_key_bytes(key_str)] = TxOutput.from_dict(utxo_data)
+
+    delta_path = _path("utxo_delta.log")
+    if os.path.exists(delta_path):
+        pos = 0
+        with open(delta_path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("línea sin terminar")
+                    entry = _json_loads(line)
+                except ValueError:
+                    # Línea cortada por un cierre abrupto: es la última, y se
+                    # corta el archivo ahí para que el próximo delta no se le pegue
+                    print("⚠️  utxo_delta.log con una línea incompleta, descartándola")
+                    break
+                pos += len(line)
+                if height is not None and entry["height"] <= height:
+                    continue   # ya está en el snapshot
+                for key_str in entry["removed"]:
+                    key = _utxo_key_bytes(key_str)
+                    out = utxo_set.pop(key, None)
+                    if out is not None and utxo_hash is not None:
+                        utxo_hash.remove(utxo_bytes(key, out))
+                for key_str, utxo_data in entry["added"].items():
+                    key = _utxo_key_bytes(key_str)
+                    out = utxo_set[key] = TxOutput.from_dict(utxo_data)
+                    if utxo_hash is not None:
+                        utxo_hash.insert(utxo_bytes(key, out))
+                height = entry["height"]
+        if pos < os.path.getsize(delta_path):
+            os.truncate(delta_path, pos)
 
     print(f"📂 UTXO set cargado ({len(utxo_set)} entradas)")
-    return utxo_set
+    return utxo_set, height, utxo_hash
 
 
 def load_mempool():
@@ -144,11 +352,11 @@ def load_mempool():
         return []
 
     try:
-        with open(path, "r") as f:
+        with open(path, "rb") as f:
             content = f.read().strip()
         if not content:
             return []
-        data = json.loads(content)
+        data = _json_loads(content)
     except (json.JSONDecodeError, ValueError):
         print("⚠️  mempool.json corrupto, ignorando")
         return []
@@ -160,14 +368,13 @@ def load_mempool():
 
 def has_saved_data():
     """Devuelve True si ya existe una blockchain guardada en disco."""
-    return os.path.exists(_path("chain.json"))
+    return os.path.exists(_path("chain.log")) or os.path.exists(_path("chain.json"))
 
 
 def save_peers(peers: set):
     """Guarda la lista de peers conocidos en disco."""
     _ensure_dir()
-    with open(_path("peers.json"), "w") as f:
-        json.dump(list(peers), f, indent=2)
+    _write_atomic("peers.json", _json_dumps(list(peers)))
 
 
 def load_peers() -> list:
@@ -176,7 +383,7 @@ def load_peers() -> list:
     if not os.path.exists(path):
         return []
     try:
-        with open(path, "r") as f:
-            return json.load(f)
+        with open(path, "rb") as f:
+            return _json_loads(f.read())
     except Exception:
         return []
\ No newline at end of file
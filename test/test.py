@@ -10,6 +10,7 @@ import sys
 import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
+import json
 import time
 import unittest
 import tempfile
@@ -23,6 +24,7 @@ from core.blockchain import Blockchain, get_mining_reward, HALVING_INTERVAL, INI
 from core.block import Block
 from core.transaction import Transaction, TxInput, TxOutput, _double_sha256
 from core.wallet import Wallet
+from core.utxo import utxo_key
 
 
 # ══════════════════════════════════════════════════════════════════
@@ -30,7 +32,7 @@ from core.wallet import Wallet
 # ══════════════════════════════════════════════════════════════════
 
 def make_blockchain(difficulty=1):
-    for f in ["chain.json", "utxo_set.json", "mempool.json"]:
+    for f in ["chain.log", "chain.json", "utxo_set.json", "utxo_delta.log", "mempool.json"]:
         path = os.path.join(_TMP, f)
         if os.path.exists(path):
             os.remove(path)
@@ -41,7 +43,7 @@ def funded_wallet(bc: Blockchain, amount=100):
     w   = Wallet()
     out = TxOutput(amount=amount, recipient_public_key_pem=w.address())
     tx  = Transaction(inputs=[], outputs=[out])
-    bc.utxo_set[(tx.id, 0)] = out
+    bc.utxo_set[utxo_key(tx.id, 0)] = out
     return w, tx
 
 
@@ -68,11 +70,91 @@ class TestBlock(unittest.TestCase):
         block.index = 999
         self.assertNotEqual(block.hash, block.calculate_hash())
 
+    def test_hash_bytes_sigue_al_hash(self):
+        b = Block(index=1, timestamp=time.time(), transactions=[],
+                  previous_hash="0" * 64, difficulty=1)
+        b.hash = "ab" * 32
+        self.assertEqual(b.hash_bytes, bytes.fromhex("ab" * 32))
+
+    def test_cache_de_json_compartida_y_ligada_al_hash(self):
+        b = Block(index=1, timestamp=time.time(), transactions=[],
+                  previous_hash="0" * 64, difficulty=1)
+        llamadas = []
+
+        def build(block):
+            llamadas.append(block.hash)
+            return block.hash.encode()
+
+        self.assertEqual(b.cached_json("wire", build), b.hash.encode())
+        b.cached_json("wire", build)
+        self.assertEqual(len(llamadas), 1)
+        b.hash = "ab" * 32
+        self.assertEqual(b.cached_json("wire", build), b"ab" * 32)
+        b.transactions.append(Transaction([], [TxOutput(1, b"x")]))
+        b.cached_json("wire", build)
+        self.assertEqual(len(llamadas), 3)
+
+    def test_cambiar_txs_despues_del_hash_invalida_hash(self):
+        bc = make_blockchain(difficulty=1)
+        bc.mine_pending_transactions(b"miner")
+        block = bc.get_latest_block()
+        self.assertEqual(block.hash, block.calculate_hash())   # caches llenas
+
+        block.transactions[0] = Transaction([], [TxOutput(999999, b"ladron")])
+        self.assertNotEqual(block.hash, block.calculate_hash())
+        self.assertEqual(block.to_dict()["transactions"][0]["outputs"][0]["amount"], 999999)
+
+        block.transactions = []
+        self.assertNotEqual(block.hash, block.calculate_hash())
+
     def test_serializacion_deterministica(self):
         bc    = make_blockchain()
         block = bc.chain[0]
         self.assertEqual(block.calculate_hash(), block.calculate_hash())
 
+    def test_minado_paralelo_valido(self):
+        bloque = Block(
+            index         = 1,
+            timestamp     = time.time(),
+            transactions  = [Transaction([], [TxOutput(50, b"miner")])],
+            previous_hash = "0",
+            difficulty    = 3,
+            workers       = 2,
+        )
+        self.assertTrue(bloque.hash.startswith("000"))
+        self.assertEqual(bloque.hash, bloque.calculate_hash())
+
+    def test_minado_paralelo_sin_workers_vivos_mina_en_el_proceso(self):
+        from core import block as block_module
+        original = block_module._pow_worker
+        block_module._pow_worker = lambda *args: os._exit(1)   # mueren sin resultado
+        try:
+            bloque = Block(1, time.time(), [Transaction([], [TxOutput(50, b"miner")])],
+                           "0", difficulty=3, workers=1)
+            digest = bloque.mine_block_parallel(workers=2)
+        finally:
+            block_module._pow_worker = original
+        self.assertTrue(digest.startswith("000"))
+        self.assertEqual(digest, bloque.calculate_hash())
+
+    def test_header_v1_sigue_siendo_json(self):
+        bc      = make_blockchain()
+        genesis = bc.chain[0]
+        header  = {k: v for k, v in genesis.to_dict().items() if k not in ("hash", "version")}
+        self.assertEqual(genesis.version, 1)
+        self.assertEqual(genesis.hash, _double_sha256(
+            json.dumps(header, sort_keys=True, separators=(",", ":")).encode()).hex())
+
+    def test_header_v2_compromete_txs(self):
+        bc = make_blockchain(difficulty=1)
+        bc.mine_pending_transactions(b"miner")
+        block = bc.get_latest_block()
+        self.assertEqual(block.version, 2)
+        data = json.loads(json.dumps(block.to_dict()))
+        self.assertEqual(Block.from_dict(data).calculate_hash(), block.hash)
+        data["transactions"][0]["outputs"][0]["amount"] = 999999
+        self.assertNotEqual(Block.from_dict(data).calculate_hash(), block.hash)
+
 
 # ══════════════════════════════════════════════════════════════════
 # 2. TESTS DE TRANSACCIÓN
@@ -159,6 +241,80 @@ class TestTransaction(unittest.TestCase):
         with self.assertRaises(ValueError):
             TxOutput(amount=-1, recipient_public_key_pem=w.address())
 
+    def test_tx_v2_roundtrip_y_v1_legado(self):
+        tx = Transaction([TxInput("ab" * 32, 1)], [TxOutput(12.5, b"pk")], timestamp=1_700_000_000)
+        self.assertEqual(tx.version, 2)
+        copia = Transaction.from_dict(json.loads(json.dumps(tx.to_dict())))
+        self.assertEqual(copia.hash_for_signature().hex(), tx.id)
+
+        legado = tx.to_dict()
+        del legado["version"]
+        v1 = Transaction.from_dict(legado)
+        self.assertEqual(v1.version, 1)
+        self.assertNotEqual(v1.hash_for_signature().hex(), tx.id)
+
+    def test_una_firma_para_todos_los_inputs(self):
+        bc = make_blockchain()
+        w  = Wallet()
+        for _ in range(3):
+            out = TxOutput(amount=10, recipient_public_key_pem=w.address())
+            ftx = Transaction(inputs=[], outputs=[out])
+            bc.utxo_set[utxo_key(ftx.id, 0)] = out
+        tx = w.create_transaction(bc, Wallet().address(), 25, 1)
+        self.assertEqual(len(tx.inputs), 3)
+        self.assertEqual(len({i.signature for i in tx.inputs}), 1)
+        fee, firmas = tx.check_inputs(bc.utxo_set)
+        self.assertEqual((fee, len(firmas)), (1, 1))
+        self.assertTrue(bc.add_transaction(tx))
+
+    def test_direccion_comprimida_y_pem_legada(self):
+        from core.transaction import address_from_str, address_to_str
+        bc = make_blockchain()
+        w  = Wallet()
+        self.assertEqual(len(w.address()), 33)
+        self.assertEqual(address_from_str(address_to_str(w.address())), w.address())
+
+        # Un UTXO viejo a la dirección PEM sigue siendo de la wallet y gastable
+        out = TxOutput(amount=10, recipient_public_key_pem=w._address_pem)
+        ftx = Transaction(inputs=[], outputs=[out])
+        bc.utxo_set[utxo_key(ftx.id, 0)] = out
+        nuevo = TxOutput(amount=5, recipient_public_key_pem=w.address())
+        bc.utxo_set[utxo_key(Transaction([], [nuevo]).id, 0)] = nuevo
+        self.assertEqual(w.get_balance(bc), 15)
+
+        tx = w.create_transaction(bc, Wallet().address(), 14, 1)
+        self.assertEqual(len(tx.inputs), 2)
+        self.assertTrue(bc.add_transaction(Transaction.from_dict(tx.to_dict())))
+
+    def test_seleccion_utxos_mayor_primero_y_exacto(self):
+        bc = make_blockchain()
+        w  = Wallet()
+        for amount in (10, 50, 25):
+            out = TxOutput(amount=amount, recipient_public_key_pem=w.address())
+            bc.utxo_set[utxo_key(Transaction([], [out]).id, 0)] = out
+        selected, total = w.select_utxos(bc, 30)
+        self.assertEqual(([u.amount for _, _, u in selected], total), ([50], 50))
+        selected, total = w.select_utxos(bc, 25)
+        self.assertEqual(([u.amount for _, _, u in selected], total), ([25], 25))
+        selected, total = w.select_utxos(bc, 70)
+        self.assertEqual(([u.amount for _, _, u in selected], total), ([50, 25], 75))
+
+    def test_utxo_key_36_bytes(self):
+        from core.utxo import split_utxo_key
+        tx_id = "ab" * 32
+        key   = utxo_key(tx_id, 7)
+        self.assertEqual(len(key), 36)
+        self.assertEqual(split_utxo_key(key), (tx_id, 7))
+
+    def test_id_falso_rechazado(self):
+        bc     = make_blockchain()
+        w, ftx = funded_wallet(bc, amount=100)
+        inp    = TxInput(tx_id=ftx.id, output_index=0)
+        tx     = Transaction(inputs=[inp], outputs=[TxOutput(100, Wallet().address())])
+        inp.sign(tx.hash_for_signature(), w.private_key)
+        tx.id  = ftx.id   # id ajeno: sus outputs pisarían UTXOs de otra TX
+        self.assertFalse(bc.add_transaction(tx))
+
     def test_double_sha256(self):
         import hashlib
         data   = b"test data"
@@ -200,8 +356,277 @@ class TestBlockchain(unittest.TestCase):
         block = bc.chain[1]
         tx_id = block.transactions[0].id
         tx, bi = bc.get_transaction(tx_id)
-        self.assertIsNotNone(tx)
+        self.assertIs(tx, block.transactions[0])
         self.assertEqual(bi, 1)
+        self.assertIs(bc.get_block_by_hash(block.hash), block)
+        self.assertIsNone(bc.get_block_by_hash("00" * 32))
+
+    def test_validar_bloque_no_modifica_utxo_set(self):
+        bc     = make_blockchain(difficulty=1)
+        antes  = dict(bc.utxo_set)
+        bloque = Block(
+            index         = 1,
+            timestamp     = time.time(),
+            transactions  = [Transaction([], [TxOutput(50, b"miner")])],
+            previous_hash = bc.chain[0].hash,
+            difficulty    = 1,
+        )
+        self.assertTrue(bc.validate_block(bloque))
+        self.assertEqual(bc.utxo_set, antes)
+        self.assertTrue(bc.add_block(bloque))
+        self.assertIn(utxo_key(bloque.transactions[0].id, 0), bc.utxo_set)
+
+    def test_minado_prioriza_fee(self):
+        from core.blockchain import MAX_TX_PER_BLOCK
+        bc = make_blockchain(difficulty=1)
+        w2 = Wallet()
+        for fee in range(MAX_TX_PER_BLOCK + 2):
+            w, fund = funded_wallet(bc, amount=100)
+            inp     = TxInput(tx_id=fund.id, output_index=0)
+            tx      = Transaction(inputs=[inp], outputs=[TxOutput(100 - fee, w2.address())])
+            inp.sign(tx.hash_for_signature(), w.private_key)
+            self.assertTrue(bc.add_transaction(tx))
+
+        bc.mine_pending_transactions(b"miner")
+        fees = [100 - tx.outputs[0].amount for tx in bc.chain[1].transactions[1:]]
+        self.assertEqual(fees, sorted(range(2, MAX_TX_PER_BLOCK + 2), reverse=True))
+        self.assertEqual(len(bc.pending_transactions), 2)
+        self.assertEqual(len(bc.mempool_heap), 2)
+
+    def test_validar_cadena_firmas_en_paralelo(self):
+        import core.blockchain as blockchain_module
+        bc     = make_blockchain(difficulty=1)
+        w, ftx = funded_wallet(bc, amount=100)
+        bc.chain[0].transactions.append(ftx)   # que el fondeo figure en la cadena
+        inp    = TxInput(tx_id=ftx.id, output_index=0)
+        tx     = Transaction(inputs=[inp], outputs=[TxOutput(90, Wallet().address())])
+        inp.sign(tx.hash_for_signature(), w.private_key)
+        self.assertTrue(bc.add_transaction(tx))
+        bc.mine_pending_transactions(b"miner")
+
+        minimo = blockchain_module.PARALLEL_VERIFY_MIN_SIGS
+        blockchain_module.PARALLEL_VERIFY_MIN_SIGS = 1
+        try:
+            self.assertTrue(bc.validate_chain(workers=2, full=True))
+            inp.signature = inp.signature[:-1] + bytes([inp.signature[-1] ^ 1])
+            self.assertFalse(bc.validate_chain(workers=2, full=True))
+        finally:
+            blockchain_module.PARALLEL_VERIFY_MIN_SIGS = minimo
+
+    def test_entradas_repetidas_del_heap_no_rompen_el_minado(self):
+        import heapq
+        bc     = make_blockchain(difficulty=1)
+        w, ftx = funded_wallet(bc, amount=100)
+        tx = w.create_transaction(bc, Wallet().address(), 60, 1)
+        self.assertTrue(bc.add_transaction(tx))
+        # Como tras un reorg durante el minado: la misma TX dos veces en el heap
+        heapq.heappush(bc.mempool_heap, (-tx.fee, -1, tx))
+
+        self.assertTrue(bc.mine_pending_transactions(b"miner"))
+        self.assertEqual(len(bc.chain[-1].transactions), 2)   # coinbase + la TX, una vez
+        self.assertEqual(bc.pending_transactions, {})
+
+        # Una entrada que quedó de una TX ya minada no se desaloja ni se vuelve a minar
+        heapq.heappush(bc.mempool_heap, (-tx.fee, -2, tx))
+        self.assertFalse(bc._evict_lowest_fee(10 ** 9))
+        heapq.heappush(bc.mempool_heap, (-tx.fee, -3, tx))
+        self.assertTrue(bc.mine_pending_transactions(b"miner"))
+        self.assertEqual(len(bc.chain[-1].transactions), 1)
+
+    def test_validar_cadena_ajena_arma_utxo_set(self):
+        bc     = make_blockchain(difficulty=1)
+        w, ftx = funded_wallet(bc, amount=100)
+        bc.chain[0].transactions.append(ftx)
+        tx = w.create_transaction(bc, Wallet().address(), 60, 1)
+        self.assertTrue(bc.add_transaction(tx))
+        bc.mine_pending_transactions(b"miner")
+        bc.mine_pending_transactions(b"miner")
+
+        utxo = {}
+        self.assertTrue(bc.validate_chain(list(bc.chain), utxo=utxo))   # copia: cadena "ajena"
+        self.assertEqual(utxo, bc.rebuild_utxo_set())
+
+    def test_reorg_desde_el_fork_no_rearma_desde_el_genesis(self):
+        from core.muhash import MuHash
+        from core.utxo import utxo_bytes
+        bc     = make_blockchain(difficulty=1)
+        w, ftx = funded_wallet(bc, amount=100)
+        bc.chain[0].transactions.append(ftx)
+        bc.rebuild_indexes()
+        tx = w.create_transaction(bc, Wallet().address(), 60, 1)
+        self.assertTrue(bc.add_transaction(tx))
+        bc.mine_pending_transactions(b"miner")
+        bc.mine_pending_transactions(b"miner")
+        bc.rebuild_utxo_hash()
+
+        # Deshacer desde el bloque 1 y volver a aplicar la misma rama: las
+        # salidas de esas TXs se borran y se crean de nuevo en el overlay
+        utxo = bc.rewind_utxo(1)
+        self.assertEqual(len(bc.utxo_set), len(bc.rebuild_utxo_set()))   # no tocó el real
+        self.assertTrue(bc.validate_chain(list(bc.chain), utxo=utxo, start=1))
+        bc.commit_utxo(utxo)
+        self.assertEqual(dict(bc.utxo_set), bc.rebuild_utxo_set())
+        self.assertEqual(bc.utxo_hash.hexdigest(),
+                         MuHash.of(utxo_bytes(k, o) for k, o in bc.utxo_set.items()).hexdigest())
+
+    def test_validar_cadena_propia_es_estructural(self):
+        bc     = make_blockchain(difficulty=1)
+        w, ftx = funded_wallet(bc, amount=100)
+        bc.chain[0].transactions.append(ftx)
+        inp    = TxInput(tx_id=ftx.id, output_index=0)
+        tx     = Transaction(inputs=[inp], outputs=[TxOutput(90, Wallet().address())])
+        inp.sign(tx.hash_for_signature(), w.private_key)
+        self.assertTrue(bc.add_transaction(tx))
+        bc.mine_pending_transactions(b"miner")
+
+        # Una firma rota en la cadena propia solo la detecta el modo completo
+        inp.signature = inp.signature[:-1] + bytes([inp.signature[-1] ^ 1])
+        self.assertTrue(bc.validate_chain())
+        self.assertFalse(bc.validate_chain(full=True))
+
+        # Pero el monto de la coinbase (recompensa + fee) sí se revisa
+        bc.chain[1].transactions[0].outputs[0].amount += 1
+        self.assertFalse(bc.validate_chain())
+
+    def test_cache_de_txs_validadas(self):
+        import core.blockchain as blockchain_module
+        bc   = make_blockchain(difficulty=1)
+        w, _ = funded_wallet(bc, amount=100)
+        tx   = w.create_transaction(bc, Wallet().address(), 50, 1)
+        self.assertTrue(bc.add_transaction(tx))
+        self.assertIn(tx.id, bc.validated_txs)
+
+        # Mismo id pero otra firma: no se confía en el cache
+        trucha = Transaction.from_dict(tx.to_dict())
+        trucha.inputs[0].signature = bytes(len(tx.inputs[0].signature))
+        bloque = Block(
+            index         = 1,
+            timestamp     = time.time(),
+            transactions  = [Transaction([], [TxOutput(get_mining_reward(1) + 1, b"miner")]), trucha],
+            previous_hash = bc.chain[0].hash,
+            difficulty    = 1,
+        )
+        self.assertFalse(bc.validate_block(bloque))
+
+        llamadas = []
+        original = blockchain_module.verify_signature
+        blockchain_module.verify_signature = lambda *f: llamadas.append(f) or original(*f)
+        try:
+            self.assertTrue(bc.mine_pending_transactions(b"miner"))
+        finally:
+            blockchain_module.verify_signature = original
+        self.assertEqual(llamadas, [])
+
+    def test_persistencia_incremental(self):
+        bc = make_blockchain(difficulty=1)
+        for _ in range(3):
+            bc.mine_pending_transactions(b"miner")
+
+        cargada = Blockchain(difficulty=1)
+        self.assertEqual([b.hash for b in cargada.chain], [b.hash for b in bc.chain])
+        self.assertEqual(set(cargada.utxo_set), set(bc.utxo_set))
+        self.assertTrue(cargada.validate_chain())
+
+    def test_snapshot_por_tope_de_deltas(self):
+        bc   = make_blockchain(difficulty=1)
+        tope = storage_module.UTXO_DELTA_MAX_OPS
+        storage_module.UTXO_DELTA_MAX_OPS = 1
+        try:
+            bc.mine_pending_transactions(b"miner")
+            bc.mine_pending_transactions(b"miner")
+        finally:
+            storage_module.UTXO_DELTA_MAX_OPS = tope
+
+        with open(os.path.join(storage_module.DATA_DIR, "utxo_delta.log")) as f:
+            self.assertEqual(f.read(), "")
+        cargada = Blockchain(difficulty=1)
+        self.assertEqual(set(cargada.utxo_set), set(bc.utxo_set))
+
+    def test_registro_cortado_no_rompe_el_siguiente_agregado(self):
+        bc = make_blockchain(difficulty=1)
+        bc.mine_pending_transactions(b"miner")
+        # Cierre abrupto a mitad de un append en los dos logs
+        with open(os.path.join(storage_module.DATA_DIR, "chain.log"), "ab") as f:
+            f.write((500).to_bytes(4, "big") + b'{"index": 2, "tim')
+        with open(os.path.join(storage_module.DATA_DIR, "utxo_delta.log"), "ab") as f:
+            f.write(b'{"height": 2, "add')
+
+        cargada = Blockchain(difficulty=1)
+        self.assertEqual(len(cargada.chain), 2)
+        cargada.mine_pending_transactions(b"miner")
+
+        otra = Blockchain(difficulty=1)
+        self.assertEqual([b.hash for b in otra.chain], [b.hash for b in cargada.chain])
+        self.assertEqual(set(otra.utxo_set), set(cargada.utxo_set))
+        self.assertEqual(otra.utxo_hash.hexdigest(), cargada.utxo_hash.hexdigest())
+
+    def test_escrituras_concurrentes_de_la_mempool(self):
+        import contextlib, io, threading
+        bc     = make_blockchain(difficulty=1)
+        w, tx  = funded_wallet(bc)
+        errores = []
+
+        def guardar():
+            for _ in range(100):
+                try:
+                    storage_module.save_mempool([tx])
+                except Exception as e:
+                    errores.append(e)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            hilos = [threading.Thread(target=guardar) for _ in range(2)]
+            for h in hilos:
+                h.start()
+            for h in hilos:
+                h.join()
+
+        self.assertEqual(errores, [])
+        self.assertEqual([t.id for t in storage_module.load_mempool()], [tx.id])
+        self.assertEqual([f for f in os.listdir(storage_module.DATA_DIR) if f.endswith(".tmp")], [])
+
+    def test_corte_entre_snapshot_y_vaciado_de_deltas(self):
+        bc = make_blockchain(difficulty=1)
+        bc.mine_pending_transactions(b"miner")
+        bc.mine_pending_transactions(b"miner")
+        delta_path = os.path.join(storage_module.DATA_DIR, "utxo_delta.log")
+        with open(delta_path, "rb") as f:
+            deltas = f.read()
+        self.assertTrue(deltas)
+
+        # Snapshot escrito pero el log de deltas no llegó a vaciarse
+        storage_module.save_utxo_set(bc.utxo_set, height=len(bc.chain) - 1, utxo_hash=bc.utxo_hash)
+        with open(delta_path, "wb") as f:
+            f.write(deltas)
+
+        cargada = Blockchain(difficulty=1)
+        self.assertEqual(set(cargada.utxo_set), set(bc.utxo_set))
+        self.assertEqual(cargada.utxo_hash.hexdigest(), bc.utxo_hash.hexdigest())
+
+    def test_muhash_utxo_incremental(self):
+        from core.muhash import MuHash
+        from core.utxo import utxo_bytes
+        bc = make_blockchain(difficulty=1)
+        for _ in range(3):
+            bc.mine_pending_transactions(b"miner")
+        completo = MuHash.of(utxo_bytes(k, out) for k, out in bc.utxo_set.items())
+        self.assertEqual(bc.utxo_hash.hexdigest(), completo.hexdigest())
+        self.assertEqual(Blockchain(difficulty=1).utxo_hash.hexdigest(), completo.hexdigest())
+
+    def test_indice_utxo_por_dueno(self):
+        bc       = make_blockchain(difficulty=1)
+        w, _     = funded_wallet(bc, amount=100)
+        receptor = Wallet()
+        tx       = w.create_transaction(bc, receptor.address(), 60, 5)
+        self.assertTrue(bc.add_transaction(tx))
+        bc.mine_pending_transactions(b"miner")
+
+        self.assertEqual(w.get_balance(bc), 35)
+        self.assertEqual(receptor.get_balance(bc), 60)
+        for dueno, utxos in bc.utxo_set.by_owner.items():
+            self.assertEqual(utxos, {k: o for k, o in bc.utxo_set.items()
+                                     if o.recipient_public_key == dueno})
+            self.assertEqual(bc.utxo_set.balance_of(dueno), sum(o.amount for o in utxos.values()))
+        self.assertEqual(set(bc.utxo_set.balances), set(bc.utxo_set.by_owner))
 
     def test_tx_inexistente_devuelve_none(self):
         bc     = make_blockchain()
@@ -268,6 +693,21 @@ class TestAtaques(unittest.TestCase):
         )
         self.assertFalse(bc.add_block(bloque_vacio))
 
+    def test_bloque_mal_formado_es_invalido_sin_excepcion(self):
+        bc = make_blockchain(difficulty=1)
+        for campo, valor in [("timestamp", "ayer"), ("difficulty", "1"), ("nonce", 2 ** 70)]:
+            bloque = Block(
+                index         = 1,
+                timestamp     = time.time(),
+                transactions  = [Transaction([], [TxOutput(50, b"miner")])],
+                previous_hash = bc.chain[0].hash,
+                difficulty    = 1,
+            )
+            bloque.mine_block()
+            setattr(bloque, campo, valor)
+            self.assertFalse(bc.add_block(bloque), campo)
+        self.assertEqual(len(bc.chain), 1)
+
     def test_cadena_alternativa_corta_rechazada(self):
         bc = make_blockchain(difficulty=1)
         for _ in range(5):
@@ -284,7 +724,7 @@ class TestAtaques(unittest.TestCase):
         for i in range(MAX_MEMPOOL_SIZE + 5):
             out        = TxOutput(1, w.address())
             fake_tx_id = hashlib.sha256(f"fake-{i}".encode()).hexdigest()
-            bc.utxo_set[(fake_tx_id, 0)] = out
+            bc.utxo_set[utxo_key(fake_tx_id, 0)] = out
 
         w2        = Wallet()
         aceptadas = 0
@@ -299,6 +739,172 @@ class TestAtaques(unittest.TestCase):
 
         self.assertLessEqual(aceptadas, MAX_MEMPOOL_SIZE)
 
+    def test_mempool_llena_desaloja_menor_fee(self):
+        import core.blockchain as blockchain_module
+        bc     = make_blockchain()
+        w2     = Wallet()
+        maximo = blockchain_module.MAX_MEMPOOL_SIZE
+        blockchain_module.MAX_MEMPOOL_SIZE = 2
+        try:
+            txs = []
+            for fee in (1, 5, 3):
+                w, fund = funded_wallet(bc, amount=100)
+                inp     = TxInput(tx_id=fund.id, output_index=0)
+                tx      = Transaction(inputs=[inp], outputs=[TxOutput(100 - fee, w2.address())])
+                inp.sign(tx.hash_for_signature(), w.private_key)
+                txs.append(tx)
+            self.assertTrue(bc.add_transaction(txs[0]))
+            self.assertTrue(bc.add_transaction(txs[1]))
+            self.assertTrue(bc.add_transaction(txs[2]))   # desaloja la de fee 1
+        finally:
+            blockchain_module.MAX_MEMPOOL_SIZE = maximo
+
+        self.assertEqual(set(bc.pending_transactions), {txs[1].id, txs[2].id})
+        self.assertNotIn(utxo_key(txs[0].inputs[0].tx_id, 0), bc.locked_utxos)
+
+    def test_tope_de_peers_desaloja_al_mas_lento(self):
+        from network import node as node_module
+        node = node_module.Node(host="127.0.0.1", port=0, blockchain=make_blockchain())
+        tope = node_module.MAX_PEERS
+        try:
+            urls = [f"http://10.0.0.{i}:8000" for i in range(tope)]
+            with node._lock:
+                node._add_peers_locked(urls)
+            for url in urls:
+                node._peer_latency[url] = 0.05
+            node._peer_latency[urls[7]] = 3.0   # el más lento
+
+            # Un peer medido (respondió un handshake) más rápido que el peor
+            with node._lock:
+                entraron = node._add_peers_locked(["http://10.0.1.1:8000"], latencia=0.05)
+            self.assertEqual(entraron, ["http://10.0.1.1:8000"])
+            self.assertEqual(len(node.peers), tope)
+            self.assertNotIn(urls[7], node.peers)
+            self.assertIn("http://10.0.1.1:8000", node.peers)
+            self.assertNotIn(urls[7], node._peer_latency)
+
+            # Uno medido más lento que todos no desaloja a nadie
+            with node._lock:
+                entraron = node._add_peers_locked(["http://10.0.1.2:8000"], latencia=4.0)
+            self.assertEqual(entraron, [])
+            self.assertNotIn("http://10.0.1.2:8000", node.peers)
+        finally:
+            node._sender.shutdown(wait=False)
+
+    def test_status_push_con_remitente_y_url_falsificados(self):
+        from network import node as node_module
+        from network.api import create_app
+        node = node_module.Node(host="127.0.0.1", port=0, blockchain=make_blockchain())
+        try:
+            honesto = "http://10.0.0.1:8000"
+            with node._lock:
+                node._add_peers_locked([honesto, "http://10.0.0.2:8000"])
+            client = create_app(node.blockchain, node).test_client()
+
+            def push(ip, chain_length):
+                body = json.dumps({"_sender_url": honesto, "url": honesto,
+                                   "chain_length": chain_length})
+                return client.post("/p2p/status_push", data=body,
+                                   environ_base={"REMOTE_ADDR": ip})
+
+            self.assertEqual(push("10.0.0.1", 5).status_code, 200)
+            # El atacante (otro peer, otra IP) falsifica los dos campos
+            self.assertEqual(push("10.0.0.2", 999).status_code, 403)
+            self.assertEqual(node._peer_status[honesto][0]["chain_length"], 5)
+        finally:
+            node._sender.shutdown(wait=False)
+
+    def test_trafico_p2p_no_gasta_el_cupo_de_la_api(self):
+        import network.api as api_module
+        from network import node as node_module
+        node = node_module.Node(host="127.0.0.1", port=0, blockchain=make_blockchain())
+        try:
+            client = api_module.create_app(node.blockchain, node).test_client()
+            for _ in range(api_module.RATE_LIMIT_REQUESTS):
+                self.assertEqual(client.post("/p2p/status_push", data="{}").status_code, 403)
+            self.assertEqual(client.get("/status").status_code, 200)
+        finally:
+            node._sender.shutdown(wait=False)
+
+    def test_bloque_que_llega_durante_un_reorg_no_corrompe_el_utxo_set(self):
+        import threading
+        from network import node as node_module
+        bc = make_blockchain(difficulty=1)
+        bc.mine_pending_transactions(b"a")
+        bc.mine_pending_transactions(b"b")
+        bc.mine_pending_transactions(b"b")
+        ajena = [b.to_dict() for b in bc.chain]   # 4 bloques
+
+        # Nuestra rama: se separa en el bloque 2
+        bc.chain = bc.chain[:2]
+        bc.utxo_set = bc.rebuild_utxo_set()
+        bc.rebuild_utxo_hash()
+        bc.rebuild_indexes()
+        bc.mine_pending_transactions(b"a")
+
+        # El minero agrega un bloque mientras se valida la cadena ajena
+        validar = bc.validate_chain
+        minero  = threading.Thread(target=bc.mine_pending_transactions, args=(b"c",))
+
+        def validar_con_bloque_en_el_medio(*args, **kwargs):
+            minero.start()
+            minero.join(timeout=1)
+            return validar(*args, **kwargs)
+
+        bc.validate_chain = validar_con_bloque_en_el_medio
+        node = node_module.Node(host="127.0.0.1", port=0, blockchain=bc)
+        try:
+            node._adopt_chain(ajena, "http://10.0.0.1:8000")
+            minero.join()
+        finally:
+            node._sender.shutdown(wait=False)
+
+        self.assertEqual([b.hash for b in bc.chain], [b["hash"] for b in ajena])
+        self.assertEqual({k: o.to_dict() for k, o in bc.utxo_set.items()},
+                         {k: o.to_dict() for k, o in bc.rebuild_utxo_set().items()})
+
+    def test_peers_add_con_el_tope_lleno_no_desaloja_peers_honestos(self):
+        from network import node as node_module
+        node = node_module.Node(host="127.0.0.1", port=0, blockchain=make_blockchain())
+        node._probar_candidato = lambda *a: None   # sin red: las pruebas no responden
+        tope = node_module.MAX_PEERS
+        try:
+            honestos = [f"http://10.0.0.{i}:8000" for i in range(tope)]
+            with node._lock:
+                node._add_peers_locked(honestos)
+            for url in honestos:
+                node._peer_latency[url] = 0.05
+
+            falsos = [f"http://10.6.6.{i}:8000" for i in range(tope)]
+            node.handle_peers_add({"peers": falsos})
+            node.handle_handshake({"url": falsos[0], "version": node_module.VERSION})
+
+            self.assertEqual(node.peers, set(honestos))
+        finally:
+            node._sender.shutdown(wait=False)
+
+    def test_status_push_no_pisa_el_estado_de_otro_peer(self):
+        from network import node as node_module
+        node = node_module.Node(host="127.0.0.1", port=0, blockchain=make_blockchain())
+        try:
+            honesto, atacante = "http://10.0.0.1:8000", "http://10.0.0.2:8000"
+            with node._lock:
+                node._add_peers_locked([honesto, atacante])
+            node.handle_status_push({"_sender_url": honesto, "url": honesto,
+                                     "chain_length": 5})
+
+            # El atacante dice ser el peer honesto
+            node.handle_status_push({"_sender_url": atacante, "url": honesto,
+                                     "chain_length": 999})
+            # Un remitente que no es peer
+            node.handle_status_push({"_sender_url": "http://10.9.9.9:8000",
+                                     "chain_length": 999})
+
+            self.assertEqual(node._peer_status[honesto][0]["chain_length"], 5)
+            self.assertEqual(set(node._peer_status), {honesto})
+        finally:
+            node._sender.shutdown(wait=False)
+
 
 # ══════════════════════════════════════════════════════════════════
 # MAIN